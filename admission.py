@@ -0,0 +1,209 @@
+"""Admit or reject the commands before they wait for the remote.
+
+Each command waits for its shutter, the serial link and the RF airtime,
+and holds a server thread meanwhile. The admission control rejects a
+command at once (HTTP 429 with a Retry-After) when its client has used
+its token bucket, when too many commands are already waiting, or when the
+predicted wait exceeds a deadline, so that a flood costs a dictionary
+lookup instead of a blocked thread.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import math
+import threading
+import time
+
+import somfy_frame_generator as frame_generator
+
+# Default limits (see the "Admission" settings), the admission control is
+# disabled by default
+DEFAULT_ENABLE = False
+DEFAULT_RATE = 5
+DEFAULT_BURST = 10
+DEFAULT_MAX_QUEUE = 16
+DEFAULT_MAX_WAIT = 5
+
+# Forget the full buckets when there are more clients than this
+MAX_CLIENTS = 1024
+
+# Weight of the last command in the average service time
+SERVICE_TIME_WEIGHT = 0.2
+
+
+def admission_settings(config_file_path: str) -> dict:
+    """Return the "Admission" settings, with the default values."""
+    _config = frame_generator.read_config_file(config_file_path)
+    _admission = _config.get("Admission", {})
+
+    return {
+        "enable": bool(_admission.get("enable", DEFAULT_ENABLE)),
+        "rate": float(_admission.get("rate", DEFAULT_RATE)),
+        "burst": float(_admission.get("burst", DEFAULT_BURST)),
+        "max_queue": int(_admission.get("max_queue", DEFAULT_MAX_QUEUE)),
+        "max_wait": float(_admission.get("max_wait", DEFAULT_MAX_WAIT)),
+    }
+
+
+class Rejected(Exception):
+    """A command has not been admitted."""
+
+    def __init__(self, reason: str, retry_after: float) -> None:
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """A bucket of burst tokens, refilled with rate tokens per second."""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        # now may precede the creation of the bucket (read before the lock)
+        elapsed = max(0, now - self.updated)
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.updated = max(now, self.updated)
+
+    def is_full(self, now: float) -> bool:
+        """Return True if the bucket has all its tokens."""
+        self._refill(now)
+        return self.tokens >= self.burst
+
+    def take(self, now: float) -> float:
+        """Take a token.
+
+        Returns:
+            float: 0 if a token was taken, else the time until the next
+            token (in seconds).
+        """
+        self._refill(now)
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+
+        if self.rate <= 0:
+            return math.inf
+
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionController:
+    """Bound the commands waiting for the remote, per client and in total.
+
+    The wait of a new command is predicted from the number of commands
+    already admitted and the average time to transmit a command (the RF
+    frames are sent one at a time by the remote), recorded by
+    `record_service()`. When disabled, the commands are only counted.
+    """
+
+    def __init__(
+        self,
+        enable: bool = DEFAULT_ENABLE,
+        rate: float = DEFAULT_RATE,
+        burst: float = DEFAULT_BURST,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        max_wait: float = DEFAULT_MAX_WAIT,
+    ) -> None:
+        self.enable = enable
+        self.rate = rate
+        self.burst = burst
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.service_time = frame_generator.frame_airtime()
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._admitted = 0
+        self._last_end = 0
+
+    def predicted_wait(self) -> float:
+        """Return the predicted wait of a new command (in seconds)."""
+        return self._admitted * self.service_time
+
+    def _bucket(self, client: str, now: float) -> TokenBucket:
+        if client not in self._buckets and len(self._buckets) >= MAX_CLIENTS:
+            self._buckets = {
+                key: bucket
+                for key, bucket in self._buckets.items()
+                if not bucket.is_full(now)
+            }
+
+        return self._buckets.setdefault(
+            client, TokenBucket(self.rate, self.burst)
+        )
+
+    def _admit(self, client: str) -> None:
+        now = time.monotonic()
+
+        with self._lock:
+            if not self.enable:
+                self._admitted += 1
+                return
+
+            if self._admitted >= self.max_queue:
+                self.rejected += 1
+                raise Rejected(
+                    f"Too many commands waiting ({self._admitted}).",
+                    self.predicted_wait(),
+                )
+
+            if self.predicted_wait() > self.max_wait:
+                self.rejected += 1
+                raise Rejected(
+                    "The predicted wait is too long"
+                    f" ({self.predicted_wait():.1f} s).",
+                    self.predicted_wait() - self.max_wait,
+                )
+
+            retry_after = self._bucket(client, now).take(now)
+            if retry_after:
+                self.rejected += 1
+                raise Rejected(
+                    f"Too many commands from {client}.", retry_after
+                )
+
+            self._admitted += 1
+
+    def record_service(self, start: float) -> None:
+        """Record a command echoed now, whose transmission began at start.
+
+        Only the time on the link counts, not the coalescing windows or
+        the waits for the pins: the command occupied the remote since its
+        transmission began or since the previous one ended, whichever is
+        the latest.
+
+        Args:
+            start (float): The time.monotonic() of the first try.
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            self.service_time += SERVICE_TIME_WEIGHT * (
+                now - max(start, self._last_end) - self.service_time
+            )
+            self._last_end = now
+
+    def _release(self) -> None:
+        with self._lock:
+            self._admitted -= 1
+
+    @contextlib.contextmanager
+    def admit(self, client: str | None):
+        """Admit a command of a client for the enclosed block.
+
+        Raises:
+            Rejected: If the command is not admitted.
+        """
+        self._admit(client or "unknown")
+
+        try:
+            yield
+
+        finally:
+            self._release()
@@ -0,0 +1,216 @@
+"""Compare the Flask and the asyncio servers.
+
+Each backend is started in its own process with a mocked remote, then the
+script reports its import time, its resident memory (RSS, Linux only) and
+the latency of the requests sent on a kept-alive connection.
+
+Usage:
+    python benchmarks/bench_backends.py [--requests 500]
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# pylint: disable=wrong-import-position
+import somfy_frame_generator as frame_generator  # noqa: E402
+
+BACKENDS = ("flask", "asyncio")
+PATHS = ("/health", "/?name=shutter%200&action=stop")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _write_settings(directory: str) -> str:
+    """Write settings with a mocked remote in a temporary directory."""
+    with open(
+        os.path.join(ROOT, "settings_default.json"), "r", encoding="utf-8"
+    ) as file:
+        settings = json.load(file)
+
+    settings["Test"]["remote_mocking"] = True
+    # The benchmark measures the servers, its requests must not be rejected
+    settings["Admission"]["enable"] = False
+    path = os.path.join(directory, "settings.json")
+
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(settings, file, indent=4)
+
+    # Create the counter files, like routine.display_settings()
+    for conf in settings["shutters"].values():
+        frame_generator.save_counter(
+            os.path.join(directory, "counters", f"{conf['id']}.txt")
+        )
+
+    return path
+
+
+def _rss_kib(pid: int) -> int | None:
+    """Return the resident memory of a process in KiB (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="utf-8") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+
+    except FileNotFoundError:
+        pass
+
+    return None
+
+
+def serve(backend: str, port: int, settings_file: str) -> None:
+    """Start a backend (in the child process)."""
+    start = time.perf_counter()
+
+    if backend == "flask":
+        from flask_route import (  # pylint: disable=import-outside-toplevel
+            web_app,
+        )
+
+    else:
+        import embedded_server  # pylint: disable=import-outside-toplevel
+
+    import_time = time.perf_counter() - start
+
+    from service import (  # pylint: disable=import-outside-toplevel
+        create_config,
+    )
+
+    logger = logging.getLogger("bench")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    config = create_config(settings_file, logger)
+    config["SUPERVISOR"].wait_connected(5)
+
+    print(f"READY {import_time}", flush=True)
+
+    if backend == "flask":
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        web_app.config.update(config)
+        web_app.run(port=port, host="127.0.0.1")
+
+    else:
+        embedded_server.serve(config, port=port, host="127.0.0.1")
+
+
+def measure(backend: str, settings_file: str, requests: int) -> dict:
+    """Start a backend in a child process and measure it."""
+    port = _free_port()
+    child = subprocess.Popen(  # pylint: disable=consider-using-with
+        [
+            sys.executable,
+            __file__,
+            "--serve",
+            backend,
+            "--port",
+            str(port),
+            "--settings",
+            settings_file,
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+
+    try:
+        line = child.stdout.readline()
+        if not line.startswith("READY"):
+            raise RuntimeError(f"The {backend} backend did not start.")
+
+        results = {"import (ms)": float(line.split()[1]) * 1000}
+
+        # Wait for the server to listen
+        for _ in range(100):
+            try:
+                connection = http.client.HTTPConnection("127.0.0.1", port)
+                connection.connect()
+                break
+
+            except ConnectionRefusedError:
+                time.sleep(0.05)
+
+        for path in PATHS:
+            latencies = []
+            for _ in range(requests):
+                start = time.perf_counter()
+                connection.request("GET", path)
+                response = connection.getresponse()
+                response.read()
+
+                if response.status != 200:
+                    raise RuntimeError(
+                        f"{path} answered {response.status} on the"
+                        f" {backend} backend."
+                    )
+
+                latencies.append((time.perf_counter() - start) * 1000)
+
+            latencies.sort()
+            results[f"{path} p50 (ms)"] = statistics.median(latencies)
+            results[f"{path} p99 (ms)"] = latencies[
+                int(len(latencies) * 0.99) - 1
+            ]
+
+        connection.close()
+        results["RSS (MiB)"] = (_rss_kib(child.pid) or 0) / 1024
+        return results
+
+    finally:
+        child.kill()
+        child.wait()
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--backends", nargs="+", default=BACKENDS)
+    parser.add_argument("--serve", choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--settings", help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+
+    if arguments.serve:
+        serve(arguments.serve, arguments.port, arguments.settings)
+        return
+
+    directory = tempfile.mkdtemp()
+    try:
+        settings_file = _write_settings(directory)
+        results = {
+            backend: measure(backend, settings_file, arguments.requests)
+            for backend in arguments.backends
+        }
+
+    finally:
+        shutil.rmtree(directory)
+
+    metrics = list(next(iter(results.values())))
+    print(f"{'':28}" + "".join(f"{backend:>12}" for backend in results))
+    for metric in metrics:
+        print(
+            f"{metric:40}"
+            + "".join(f"{values[metric]:12.2f}" for values in results.values())
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Replay a capture of the serial link through the Flask routes.
+
+The commands of a capture (recorded with the "uart_capture" setting) are
+turned back into HTTP requests and sent to `flask_route.web_app`, at their
+recorded pace (divided by --speed), while the serial port is replaced by
+`uart_capture.ReplaySerial`, which answers with the recorded echoes and
+delays. The latency percentiles of the requests can then be compared from
+one version to the next, against the timing of the real Arduino.
+
+The settings (shutters) must be the ones used for the capture, they are
+copied with the counters in a temporary directory, which leaves the
+original counters untouched.
+
+Usage:
+    python benchmarks/bench_replay.py capture.bin --settings settings.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# pylint: disable=wrong-import-position
+import somfy_frame_generator as frame_generator  # noqa: E402
+from uart_capture import TX, ReplaySerial, _capture_lines  # noqa: E402
+
+
+def _copy_settings(settings_file: str, directory: str) -> str:
+    """Copy the settings and the counters in a temporary directory."""
+    settings = frame_generator.read_config_file(settings_file)
+    counters = frame_generator.counters_path(settings_file)
+
+    shutil.copytree(counters, os.path.join(directory, "counters"))
+    settings["counters_path"] = "./counters"
+    settings["schedule_path"] = "./schedule.json"
+    settings["Test"]["remote_mocking"] = False
+    settings["Test"]["uart_capture"] = None
+    settings["Tracing"] = {"enable": False}
+
+    path = os.path.join(directory, "settings.json")
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(settings, file, indent=4)
+
+    return path
+
+
+def _requests(capture: str, settings_file: str) -> list[tuple[float, str]]:
+    """Return the (time, URL) of the requests behind the captured commands.
+
+    The frames are matched to the shutters of the settings, the PULSE
+    commands are turned into pin requests and the other lines (PING, ...)
+    are skipped.
+    """
+    settings = frame_generator.read_config_file(settings_file)
+    shutters = {
+        frame_generator.str_to_int(conf["id"]): name
+        for name, conf in settings["shutters"].items()
+        if "id" in conf
+    }
+    actions = {}
+    for action, code in frame_generator.COMMANDS.items():
+        actions.setdefault(code, action.lower())
+
+    requests = []
+    for direction, timestamp, line in _capture_lines(capture):
+        payload = line.strip()
+        if direction != TX or not payload:
+            continue
+
+        if payload.startswith(b"#"):
+            payload = payload[4:]
+
+        payload = payload.decode("utf-8", "replace")
+
+        if payload.upper().startswith("PULSE("):
+            pin, delay = payload[6:-1].split(",")
+            query = {"pin": pin.strip(), "delay": delay.strip()}
+
+        elif payload.startswith("A7"):
+            code, _, remote_id = frame_generator.decode_somfy_frame(
+                payload.split(":", 1)[0]
+            )
+            if remote_id not in shutters:
+                continue
+
+            query = {"name": shutters[remote_id], "action": actions[code]}
+
+        else:
+            continue
+
+        requests.append((timestamp, f"/?{urlencode(query)}"))
+
+    return requests
+
+
+def replay(capture: str, settings_file: str, speed: float) -> list[float]:
+    """Replay a capture, return the latency of each request (in ms)."""
+    # pylint: disable-next=import-outside-toplevel
+    from flask_route import web_app
+
+    # pylint: disable-next=import-outside-toplevel
+    from service import create_config
+
+    logger = logging.getLogger("bench")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    requests = _requests(capture, settings_file)
+    config = create_config(
+        settings_file, logger, transport=ReplaySerial(capture, speed)
+    )
+    config["SUPERVISOR"].wait_connected(5)
+    web_app.config.update(config)
+
+    latencies = []
+    lock = threading.Lock()
+
+    def send(url: str) -> None:
+        start = time.perf_counter()
+        web_app.test_client().get(url)
+        with lock:
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    # Send the requests at their recorded pace (the concurrent ones too)
+    threads = []
+    origin = time.monotonic() - (requests[0][0] / speed if requests else 0)
+    for timestamp, url in requests:
+        time.sleep(max(0, origin + timestamp / speed - time.monotonic()))
+        threads.append(threading.Thread(target=send, args=(url,)))
+        threads[-1].start()
+
+    for thread in threads:
+        thread.join()
+
+    config["SUPERVISOR"].stop()
+    config["LINK"].stop()
+
+    return sorted(latencies)
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("capture")
+    parser.add_argument("--settings", default="settings.json")
+    parser.add_argument("--speed", type=float, default=1.0)
+    arguments = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        latencies = replay(
+            arguments.capture,
+            _copy_settings(arguments.settings, directory),
+            arguments.speed,
+        )
+
+    finally:
+        shutil.rmtree(directory)
+
+    if not latencies:
+        print("No command to replay.")
+        return
+
+    print(f"{'requests':12}{len(latencies):>10}")
+    for name, quantile in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99)):
+        index = max(0, int(len(latencies) * quantile) - 1)
+        print(f"{name + ' (ms)':12}{latencies[index]:>10.1f}")
+    print(f"{'mean (ms)':12}{statistics.fmean(latencies):>10.1f}")
+    print(f"{'max (ms)':12}{latencies[-1]:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
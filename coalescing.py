@@ -0,0 +1,81 @@
+"""Coalesce the bursts of commands sent to the same shutter."""
+
+from __future__ import annotations
+
+import itertools
+import threading
+
+import somfy_frame_generator as frame_generator
+
+
+def is_stop(action: str) -> bool:
+    """Return True if the action stops the shutter (STOP or MY)."""
+    return (
+        frame_generator.COMMANDS.get(str(action).upper())
+        == frame_generator.COMMANDS["STOP"]
+    )
+
+
+def coalesce_window(config_file_path: str, shutter_key: str) -> float:
+    """Return the coalescing window of a shutter in seconds.
+
+    The window is read from the "coalesce_window" of the shutter, or from
+    the top-level "coalesce_window" of the settings (0 by default).
+    """
+    _config = frame_generator.read_settings(config_file_path)
+    _shutter = _config["shutters"].get(shutter_key, {})
+
+    return float(
+        _shutter.get("coalesce_window", _config.get("coalesce_window", 0))
+    )
+
+
+class CommandSuperseded(Exception):
+    """A queued command has been superseded by a newer one."""
+
+    def __init__(self, shutter: str, action: str, newer_action: str) -> None:
+        super().__init__(
+            f"The command {action} for {shutter} has been superseded by a"
+            f" newer {newer_action}."
+        )
+        self.shutter = shutter
+        self.action = action
+        self.newer_action = newer_action
+
+
+class Coalescer:
+    """Keep track of the latest command received for each shutter.
+
+    A command registers itself when it is received, and checks whether a
+    newer command has been registered for the same shutter just before
+    being transmitted. If so, it is dropped: only the latest state of the
+    burst matters, and each frame costs a rolling code and RF airtime.
+    STOP is always transmitted, but supersedes the queued commands.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._tickets = itertools.count()
+        self._latest = {}
+
+    def register(self, shutter: str, action: str) -> int:
+        """Register a new command for a shutter, return its ticket."""
+        with self._lock:
+            ticket = next(self._tickets)
+            self._latest[shutter] = (ticket, action)
+            return ticket
+
+    def check(self, shutter: str, action: str, ticket: int) -> None:
+        """Check that no newer command has been received for the shutter.
+
+        Raises:
+            CommandSuperseded: If the command must be dropped.
+        """
+        if is_stop(action):
+            return
+
+        with self._lock:
+            latest_ticket, latest_action = self._latest[shutter]
+
+        if latest_ticket != ticket:
+            raise CommandSuperseded(shutter, action, latest_action)
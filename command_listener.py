@@ -0,0 +1,258 @@
+"""Receive compact binary commands over TCP and UDP.
+
+For the wall switches and the local scripts, a command is 4 bytes
+(big-endian), instead of an HTTP request:
+
+    request:  request ID (2 bytes), shutter index (1 byte), action code
+              (1 byte)
+    answer:   request ID (2 bytes), status (1 byte, see STATUS)
+
+The shutter index is the position of the shutter in the "shutters" of the
+settings (from 0), the action code is a Somfy command code
+(somfy_frame_generator.COMMANDS, e.g. 0x01 STOP, 0x02 UP, 0x04 DOWN).
+
+Over TCP, each message is prefixed by its length (2 bytes), and several
+commands can be sent on the same connection. Over UDP, each datagram is a
+message and is answered by an acknowledgement. A datagram sent again
+(same request ID and command, the acknowledgement was lost) is
+acknowledged with the first answer, without sending the command twice.
+
+The commands are dispatched like the HTTP requests (admission control,
+routing to the other nodes, coalescing, tracing and transmission).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import logging
+import socket
+import struct
+import threading
+import time
+
+import somfy_frame_generator as frame_generator
+from service import Request, dispatch
+
+REQUEST = struct.Struct(">HBB")
+ANSWER = struct.Struct(">HB")
+LENGTH = struct.Struct(">H")
+
+STATUS = {
+    "ok": 0,
+    "invalid_shutter": 1,
+    "invalid_action": 2,
+    "superseded": 3,
+    "rejected": 4,
+    "failed": 5,
+}
+
+# Time during which the answers to the UDP requests are kept (in seconds)
+UDP_DUPLICATE_WINDOW = 5
+
+# Threads for the invalid commands, besides one per command admitted
+EXTRA_WORKERS = 2
+
+
+def _status(status: int, body: str | bytes) -> int:
+    """Return the binary status of the response of a command."""
+    if isinstance(body, bytes):
+        body = body.decode("utf-8", "replace")
+
+    if status == 200 and body.startswith("\nTX:"):
+        return STATUS["ok"]
+
+    return {409: STATUS["superseded"], 429: STATUS["rejected"]}.get(
+        status, STATUS["failed"]
+    )
+
+
+def handle_message(message: bytes, client: str | None, config: dict) -> bytes:
+    """Send the command of a request message, return the answer message."""
+    request_id, index, code = REQUEST.unpack(message)
+
+    shutters = list(
+        frame_generator.read_settings(config["SETTINGS_FILE"])["shutters"]
+    )
+    if index >= len(shutters):
+        return ANSWER.pack(request_id, STATUS["invalid_shutter"])
+
+    actions = [
+        name
+        for name, value in frame_generator.COMMANDS.items()
+        if value == code
+    ]
+    if not actions:
+        return ANSWER.pack(request_id, STATUS["invalid_action"])
+
+    response = dispatch(
+        Request(
+            method="GET",
+            path="/",
+            query={"name": shutters[index], "action": actions[0].lower()},
+            client=client,
+        ),
+        config,
+    )
+
+    return ANSWER.pack(request_id, _status(response.status, response.body))
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    """Answer the UDP requests, once per distinct datagram."""
+
+    def __init__(self, listener: CommandListener) -> None:
+        self.listener = listener
+        self.transport = None
+        # (address, datagram) -> (time, answer future)
+        self._answers = {}
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        if len(data) != REQUEST.size:
+            self.listener.logger.debug("Invalid datagram from %s", addr)
+            return
+
+        now = time.monotonic()
+        self._answers = {
+            key: value
+            for key, value in self._answers.items()
+            if now - value[0] < UDP_DUPLICATE_WINDOW
+        }
+
+        # A new command reusing a request ID is not a duplicate
+        key = (addr, data)
+        if key not in self._answers:
+            self._answers[key] = (now, self.listener.submit(data, addr[0]))
+
+        self._answers[key][1].add_done_callback(
+            lambda future: self._answer(future, addr)
+        )
+
+    def _answer(self, future: asyncio.Future, addr) -> None:
+        if future.exception() is not None:
+            self.listener.logger.error(
+                "Could not handle the datagram from %s: %s",
+                addr,
+                future.exception(),
+            )
+            return
+
+        self.transport.sendto(future.result(), addr)
+
+
+class CommandListener:
+    """Serve the binary commands over TCP and UDP on the same port."""
+
+    def __init__(self, config: dict) -> None:
+        self.config = config
+        self.logger = config.get("LOGGER") or logging.getLogger(__name__)
+        self._loop = None
+        # Every admitted command can block a thread (up to the retries of
+        # the transmission), apart from the threads of the event loop
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=config["ADMISSION"].max_queue + EXTRA_WORKERS,
+            thread_name_prefix="CommandListener",
+        )
+
+    def submit(self, message: bytes, client: str | None) -> asyncio.Future:
+        """Handle a request message in the executor of the listener."""
+        return self._loop.run_in_executor(
+            self.executor, handle_message, message, client, self.config
+        )
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Serve the length-prefixed requests of a TCP connection."""
+        peer = writer.get_extra_info("peername")
+        client = peer[0] if isinstance(peer, tuple) else None
+
+        try:
+            while True:
+                (length,) = LENGTH.unpack(
+                    await reader.readexactly(LENGTH.size)
+                )
+                message = await reader.readexactly(length)
+
+                if length != REQUEST.size:
+                    self.logger.debug("Invalid message from %s", client)
+                    break
+
+                answer = await self.submit(message, client)
+                writer.write(LENGTH.pack(len(answer)) + answer)
+                await writer.drain()
+
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+        finally:
+            writer.close()
+
+    async def serve_forever(self, host: str, port: int) -> None:
+        """Listen on TCP and UDP until cancelled."""
+        self._loop = asyncio.get_running_loop()
+
+        await self._loop.create_datagram_endpoint(
+            lambda: _DatagramProtocol(self), local_addr=(host, port)
+        )
+        server = await asyncio.start_server(
+            self.handle_connection, host, port
+        )
+
+        async with server:
+            await server.serve_forever()
+
+
+def start(config: dict, port: int = 4243, host: str = "0.0.0.0"):
+    """Serve the binary commands in a background thread.
+
+    Args:
+        config (dict): The app config (see service.create_config()).
+        port (int, optional): The TCP and UDP port. Defaults to 4243.
+        host (str, optional): The interface. Defaults to "0.0.0.0".
+
+    Returns:
+        threading.Thread: The thread of the listener.
+    """
+    listener = CommandListener(config)
+    thread = threading.Thread(
+        target=asyncio.run,
+        args=(listener.serve_forever(host, port),),
+        name="CommandListener",
+        daemon=True,
+    )
+    thread.start()
+
+    return thread
+
+
+def send_command(
+    host: str,
+    port: int,
+    shutter_index: int,
+    action_code: int,
+    request_id: int = 0,
+    timeout: float = 15,
+) -> int:
+    """Send a command over TCP and return its status (for the scripts).
+
+    Returns:
+        int: The status of the command (see STATUS).
+    """
+    message = REQUEST.pack(request_id, shutter_index, action_code)
+
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.sendall(LENGTH.pack(len(message)) + message)
+
+        answer = b""
+        while len(answer) < LENGTH.size + ANSWER.size:
+            chunk = sock.recv(LENGTH.size + ANSWER.size - len(answer))
+            if not chunk:
+                raise ConnectionError("The listener closed the connection.")
+            answer += chunk
+
+    return ANSWER.unpack(answer[LENGTH.size :])[1]
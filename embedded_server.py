@@ -0,0 +1,184 @@
+"""Serve the routes of service.py with an asyncio HTTP/1.1 server.
+
+This server only depends on the standard library. It is meant for the
+hosts with little memory, where Flask and Werkzeug dominate the resident
+memory and the start-up time. The handlers are blocking (they wait for
+the echo of the remote), so they run in a pool of threads sized to the
+admission limits, except the cheap probes (/health), served on the event
+loop so that slow commands never delay them.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import logging
+from http import HTTPStatus
+from urllib.parse import parse_qsl, urlsplit
+
+from service import Request, Response, dispatch
+
+# Limits of the requests accepted by the server
+MAX_HEADERS = 100
+MAX_BODY = 64 * 1024
+
+# Time to wait for the next request on a kept-alive connection (in seconds)
+KEEP_ALIVE_TIMEOUT = 75
+
+# Threads for the requests other than the commands (schedule, listing,
+# positions, profile), besides one per command admitted
+EXTRA_WORKERS = 4
+
+# The routes that never block, handled on the event loop
+INLINE_PATHS = ("/health",)
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Request | None:
+    """Read a request, return None if the connection is closed."""
+    request_line = await reader.readline()
+
+    if not request_line.strip():
+        return None
+
+    method, target, _ = request_line.decode("latin-1").split(maxsplit=2)
+
+    headers = {}
+    for _ in range(MAX_HEADERS):
+        line = await reader.readline()
+
+        if line in (b"\r\n", b"\n", b""):
+            break
+
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().title()] = value.strip()
+
+    length = int(headers.get("Content-Length", 0))
+    if length > MAX_BODY:
+        raise ValueError(f"Request body too large ({length} bytes).")
+
+    body = await reader.readexactly(length) if length else b""
+    url = urlsplit(target)
+
+    return Request(
+        method=method.upper(),
+        path=url.path or "/",
+        query=dict(parse_qsl(url.query, keep_blank_values=True)),
+        body=body,
+        headers=headers,
+    )
+
+
+def _encode_response(response: Response, keep_alive: bool) -> bytes:
+    """Serialize a response."""
+    body = response.body
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+
+    try:
+        reason = HTTPStatus(response.status).phrase
+
+    except ValueError:
+        reason = ""
+
+    headers = {
+        "Content-Type": response.content_type,
+        "Content-Length": str(len(body)),
+        "Connection": "keep-alive" if keep_alive else "close",
+    }
+    headers.update(response.headers or {})
+
+    head = f"HTTP/1.1 {response.status} {reason}\r\n" + "".join(
+        f"{name}: {value}\r\n" for name, value in headers.items()
+    )
+
+    return head.encode("latin-1") + b"\r\n" + body
+
+
+class EmbeddedServer:
+    """HTTP/1.1 server (with keep-alive) calling `service.dispatch()`."""
+
+    def __init__(self, config: dict) -> None:
+        self.config = config
+        self.logger = config.get("LOGGER") or logging.getLogger(__name__)
+        # Every admitted command can block a thread (up to the retries of
+        # the transmission), the other requests have their own threads
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=config["ADMISSION"].max_queue + EXTRA_WORKERS,
+            thread_name_prefix="EmbeddedServer",
+        )
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Serve the requests of a connection."""
+        loop = asyncio.get_running_loop()
+        peer = writer.get_extra_info("peername")
+        client = peer[0] if isinstance(peer, tuple) else None
+
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(
+                        _read_request(reader), KEEP_ALIVE_TIMEOUT
+                    )
+
+                except (ValueError, asyncio.IncompleteReadError) as error:
+                    self.logger.debug("Invalid request: %s", error)
+                    writer.write(
+                        _encode_response(Response(400, "Bad Request"), False)
+                    )
+                    break
+
+                if request is None:
+                    break
+
+                request = request._replace(client=client)
+
+                keep_alive = (
+                    request.headers.get("Connection", "").lower() != "close"
+                )
+
+                try:
+                    if request.path in INLINE_PATHS:
+                        response = dispatch(request, self.config)
+
+                    else:
+                        response = await loop.run_in_executor(
+                            self.executor, dispatch, request, self.config
+                        )
+
+                except Exception:  # pylint: disable=broad-except
+                    self.logger.exception("Could not handle %s", request)
+                    response = Response(500, "Internal Server Error")
+
+                writer.write(_encode_response(response, keep_alive))
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+
+        finally:
+            writer.close()
+
+    async def serve_forever(self, host: str, port: int) -> None:
+        """Listen and serve until cancelled."""
+        server = await asyncio.start_server(
+            self.handle_connection, host, port
+        )
+
+        async with server:
+            await server.serve_forever()
+
+
+def serve(config: dict, port: int = 4242, host: str = "0.0.0.0") -> None:
+    """Run the server until interrupted.
+
+    Args:
+        config (dict): The app config (see service.create_config()).
+        port (int, optional): The TCP port. Defaults to 4242.
+        host (str, optional): The interface. Defaults to "0.0.0.0".
+    """
+    asyncio.run(EmbeddedServer(config).serve_forever(host, port))
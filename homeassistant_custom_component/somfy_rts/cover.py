@@ -4,6 +4,7 @@ from pprint import pformat
 import homeassistant.helpers.config_validation as config_validation
 import voluptuous as vol
 from homeassistant.components.cover import (
+    ATTR_POSITION,
     PLATFORM_SCHEMA,
     STATE_CLOSED,
     STATE_OPEN,
@@ -16,17 +17,30 @@ from homeassistant.core import HomeAssistant
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
 
-from .somfy_rts import RTSSomfyRollingShutter
+from .local import LocalRollingShutter, get_local_hub
+from .somfy_rts import RTSSomfyRollingShutter, get_hub
 
 _LOGGER = logging.getLogger("somfy_rts")
 
+# The local mode drives the serial port of a rts_covers checkout
+CONF_RTS_COVERS_PATH = "rts_covers_path"
+CONF_SETTINGS = "settings"
+
 # Validation of the user's configuration
-PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
-    {
-        vol.Required(CONF_NAME): config_validation.string,
-        vol.Required(CONF_IP_ADDRESS): config_validation.string,
-        vol.Required(CONF_PORT): config_validation.string,
-    }
+PLATFORM_SCHEMA = vol.All(
+    PLATFORM_SCHEMA.extend(
+        {
+            # Without a name, all the shutters of the server are added
+            vol.Optional(CONF_NAME): config_validation.string,
+            vol.Inclusive(CONF_IP_ADDRESS, "server"): config_validation.string,
+            vol.Inclusive(CONF_PORT, "server"): config_validation.string,
+            vol.Optional(CONF_RTS_COVERS_PATH): config_validation.isdir,
+            vol.Optional(CONF_SETTINGS): config_validation.isfile,
+        }
+    ),
+    config_validation.has_at_least_one_key(
+        CONF_IP_ADDRESS, CONF_RTS_COVERS_PATH
+    ),
 )
 
 
@@ -39,34 +53,62 @@ def setup_platform(
     """Set up Somfy RTS rolling shutter."""
     _LOGGER.info(pformat(config))
 
-    cover = {
-        "name": config[CONF_NAME],
-        "ip_address": config[CONF_IP_ADDRESS],
-        "port": config[CONF_PORT],
-    }
+    if CONF_RTS_COVERS_PATH in config:
+        hub = get_local_hub(
+            config[CONF_RTS_COVERS_PATH], config.get(CONF_SETTINGS)
+        )
 
-    add_entities([SomfyRTSCover(cover)])
+    else:
+        hub = get_hub(config[CONF_IP_ADDRESS], config[CONF_PORT])
+
+    # Fetch the shutters (and their travel times) with a single request
+    shutters = hub.refresh(force=True)
+
+    if CONF_NAME in config:
+        names = [config[CONF_NAME]]
+
+    else:
+        # Discover all the shutters
+        names = list(shutters)
+
+    add_entities(
+        [
+            SomfyRTSCover(
+                {
+                    "name": name,
+                    "ip_address": config.get(CONF_IP_ADDRESS),
+                    "port": config.get(CONF_PORT),
+                },
+                hub,
+                LocalRollingShutter(hub, name)
+                if CONF_RTS_COVERS_PATH in config
+                else None,
+            )
+            for name in names
+        ]
+    )
 
 
 class SomfyRTSCover(CoverEntity):
     """Representation of a Somfy RTS rolling shutter."""
 
-    def __init__(self, cover):
-        """Initialize a Somfy RTS rolling shutter."""
+    def __init__(self, cover, hub, shutter=None):
+        """Initialize a Somfy RTS rolling shutter.
+
+        The shutter is commanded through the rts_covers server, unless a
+        local shutter (serial port) is given.
+        """
         _LOGGER.info(pformat(cover))
+        self._hub = hub
         self._name = cover.get("name")
         self._ip_address = cover.get("ip_address")
         self._port = cover.get("port")
-        self._cover = RTSSomfyRollingShutter(
+        self._cover = shutter or RTSSomfyRollingShutter(
             self._ip_address, self._port, self._name
         )
         self._attr_device_class = CoverDeviceClass.SHUTTER
-        self._attr_supported_features = (
-            CoverEntityFeature.OPEN
-            | CoverEntityFeature.CLOSE
-            | CoverEntityFeature.STOP
-        )
         self._state = None
+        self._position = None
 
     def open_cover(self, **_):
         """Open the rolling shutter."""
@@ -83,9 +125,62 @@ class SomfyRTSCover(CoverEntity):
         self._cover.stop()
         self._state = None
 
+    def set_cover_position(self, **kwargs):
+        """Move the rolling shutter to a position."""
+        self._cover.set_position(kwargs[ATTR_POSITION])
+
+    def update(self):
+        """Read the last commanded state from the shared listing."""
+        shutter = self._hub.refresh().get(self._name)
+
+        if shutter is not None and shutter["state"] in (
+            STATE_OPEN,
+            STATE_CLOSED,
+        ):
+            self._state = shutter["state"]
+
+        if shutter is not None:
+            self._position = shutter.get("position")
+
+    @property
+    def supported_features(self):
+        features = (
+            CoverEntityFeature.OPEN
+            | CoverEntityFeature.CLOSE
+            | CoverEntityFeature.STOP
+        )
+
+        # The server estimates the position of the shutters with a travel
+        # time (read from the last listing, the settings can change)
+        shutter = self._hub.shutters.get(self._name) or {}
+        if shutter.get("travel_time") is not None:
+            features |= CoverEntityFeature.SET_POSITION
+
+        return features
+
+    @property
+    def current_cover_position(self):
+        return self._position
+
+    @property
+    def unique_id(self):
+        shutter = self._hub.shutters.get(self._name)
+
+        if shutter is None:
+            return None
+
+        # The shutters served by another node have no id on the router
+        if shutter.get("id") is None:
+            return f"somfy_rts_{shutter.get('node')}_{self._name}"
+
+        return f"somfy_rts_{shutter['id']}"
+
     @property
     def is_closed(self):
-        return self._state is not STATE_OPEN
+        if self._position is not None:
+            return self._position == 0
+
+        return self._state != STATE_OPEN
 
     @property
     def name(self):
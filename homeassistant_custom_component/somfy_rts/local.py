@@ -0,0 +1,149 @@
+"""Drive the Arduino of rts_covers from Home Assistant, without the server.
+
+For a single-box install, the rts_covers modules (UART link, interpreter,
+frame generator, ...) are imported from a checkout of rts_covers and the
+serial port is opened in the Home Assistant process, instead of sending
+HTTP requests to the rts_covers server. The settings file and the
+counters are the ones of the server, so an install can switch from one
+mode to the other (the server must be stopped, it holds the serial port).
+"""
+
+import importlib
+import logging
+import os
+import sys
+import threading
+
+_LOGGER = logging.getLogger("somfy_rts")
+
+_HUBS = {}
+_HUBS_LOCK = threading.Lock()
+
+# The service module of each rts_covers checkout
+_SERVICES = {}
+
+
+def _import_service(rts_covers_path):
+    """Import the service module of a rts_covers checkout.
+
+    The modules of rts_covers are top-level modules with generic names
+    (service, link, uart, ...) importing each other. They are imported
+    with the checkout first in sys.path, then moved to private names in
+    sys.modules, so that they neither shadow nor are shadowed by the
+    modules of Home Assistant and of the other integrations.
+    """
+    rts_covers_path = os.path.abspath(rts_covers_path)
+
+    if rts_covers_path in _SERVICES:
+        return _SERVICES[rts_covers_path]
+
+    names = {
+        os.path.splitext(file_name)[0]
+        for file_name in os.listdir(rts_covers_path)
+        if file_name.endswith(".py")
+    }
+    prefix = f"{__name__}._backend_{len(_SERVICES)}"
+    shadowed = {
+        name: sys.modules.pop(name) for name in names if name in sys.modules
+    }
+    sys.path.insert(0, rts_covers_path)
+
+    try:
+        service = importlib.import_module("service")
+
+    finally:
+        sys.path.remove(rts_covers_path)
+
+        for name in names:
+            module = sys.modules.pop(name, None)
+
+            if module is not None:
+                sys.modules[f"{prefix}.{name}"] = module
+
+        sys.modules.update(shadowed)
+
+    _SERVICES[rts_covers_path] = service
+
+    return service
+
+
+def get_local_hub(rts_covers_path, settings_file=None):
+    """Return the hub shared by the covers of a serial port."""
+    if settings_file is None:
+        settings_file = os.path.join(rts_covers_path, "settings.json")
+
+    with _HUBS_LOCK:
+        key = os.path.abspath(settings_file)
+
+        if key not in _HUBS:
+            _HUBS[key] = LocalHub(rts_covers_path, key)
+
+        return _HUBS[key]
+
+
+class LocalHub:
+    """The shutters of a settings file, commanded through the serial port.
+
+    The link to the Arduino (tagged commands, supervision and reconnection,
+    counters, estimated positions, scheduled commands) is the one of the
+    rts_covers server, created in process by `service.create_config()`.
+    """
+
+    def __init__(self, rts_covers_path, settings_file) -> None:
+        self.service = _import_service(rts_covers_path)
+        self.config = self.service.create_config(settings_file, _LOGGER)
+        self.shutters = {}
+        self.refresh()
+
+    def refresh(self, force=False):
+        """Return the shutters by name, with their last commanded state."""
+        _, shutters = self.config["SHUTTERS"].listing()
+        self.shutters = {shutter["name"]: shutter for shutter in shutters}
+
+        return self.shutters
+
+    def transmit(self, parameters):
+        """Send a command to the Arduino, return the response."""
+        try:
+            return self.service.transmit(parameters, self.config)
+
+        except self.service.CommandSuperseded as error:
+            _LOGGER.info("%s", error)
+            return f"S: {error}"
+
+
+class LocalRollingShutter:
+    """A Somfy RTS rolling shutter commanded through the serial port."""
+
+    def __init__(self, hub, shutter_name) -> None:
+        self.hub = hub
+        self.name = shutter_name
+
+    def _send_action(self, action):
+        response = self.hub.transmit({"name": self.name, "action": action})
+        _LOGGER.debug("%s %s: %s", self.name, action, response.strip())
+
+        return response
+
+    def stop(self):
+        """Stop the rolling shutter."""
+        return self._send_action(action="stop")
+
+    def down(self):
+        """Move the rolling shutter down."""
+        return self._send_action(action="down")
+
+    def up(self):
+        """Move the rolling shutter up."""
+        return self._send_action(action="up")
+
+    def set_position(self, position):
+        """Move the rolling shutter to a position (0 closed, 100 open)."""
+        try:
+            return self.hub.config["POSITIONS"].set_position(
+                self.name, int(position)
+            )
+
+        except ValueError as error:
+            _LOGGER.warning("%s", error)
+            return None
@@ -1,7 +1,88 @@
 """Somfy RTS integration for Home Assistant."""
 
+import logging
+import threading
+import time
+import uuid
+
 import requests
 
+_LOGGER = logging.getLogger("somfy_rts")
+
+# Minimum time between two refreshes of the shutters (in seconds)
+REFRESH_INTERVAL = 5
+
+# Number of times a command rejected by the admission control (429) is sent
+# again, and the maximum wait before sending it again (in seconds)
+MAX_RETRIES = 3
+MAX_RETRY_AFTER = 5
+
+_HUBS = {}
+_HUBS_LOCK = threading.Lock()
+
+
+def get_hub(ip_address, port):
+    """Return the hub shared by the covers of a rts_covers server."""
+    with _HUBS_LOCK:
+        return _HUBS.setdefault(
+            (ip_address, str(port)), RTSSomfyHub(ip_address, port)
+        )
+
+
+class RTSSomfyHub:
+    """The shutters served by a rts_covers server.
+
+    The shutters and their last commanded state are fetched with a single
+    request for all the covers, and refreshed with a conditional request
+    (If-None-Match) at most every REFRESH_INTERVAL seconds.
+    """
+
+    def __init__(self, ip_address, port) -> None:
+        self.ip_address = ip_address
+        self.port = port
+        self.shutters = {}
+        self._etag = None
+        self._last_refresh = 0
+        self._lock = threading.Lock()
+
+    def refresh(self, force=False):
+        """Fetch the shutters if the listing changed, return them by name."""
+        with self._lock:
+            elapsed = time.monotonic() - self._last_refresh
+            if not force and elapsed < REFRESH_INTERVAL:
+                return self.shutters
+
+            self._last_refresh = time.monotonic()
+            headers = {}
+            if self._etag is not None:
+                headers["If-None-Match"] = self._etag
+
+            try:
+                response = requests.get(
+                    f"http://{self.ip_address}:{self.port}/shutters",
+                    headers=headers,
+                    timeout=10,
+                )
+
+            except requests.RequestException as error:
+                _LOGGER.warning("Could not refresh the shutters: %s", error)
+                return self.shutters
+
+            if response.status_code == 200:
+                self._etag = response.headers.get("ETag")
+                self.shutters = {
+                    shutter["name"]: shutter
+                    for shutter in response.json()["shutters"]
+                }
+
+            elif response.status_code != 304:
+                _LOGGER.warning(
+                    "Could not refresh the shutters (%s).",
+                    response.status_code,
+                )
+
+            return self.shutters
+
 
 class RTSSomfyRollingShutter:
     """Representation of a Somfy RTS rolling shutter."""
@@ -11,11 +92,49 @@ class RTSSomfyRollingShutter:
         self.port = port
         self.name = shutter_name
 
-    def _send_action(self, action):
-        return requests.get(
-            f"http://{self.ip_address}:{self.port}/"
-            f"?name={self.name}&action={action}"
-        ).content
+    def _send_action(self, action, path="", parameter="action"):
+        # The trace ID is carried by the server down to the serial link,
+        # see tracing.py in rts_covers
+        trace_id = uuid.uuid4().hex[:16]
+        start = time.perf_counter()
+
+        for retry in range(MAX_RETRIES + 1):
+            response = requests.get(
+                f"http://{self.ip_address}:{self.port}/{path}"
+                f"?name={self.name}&{parameter}={action}",
+                headers={
+                    "X-Trace-Id": trace_id,
+                    "X-Trace-Sent": str(time.time()),
+                },
+            )
+
+            # Rejected by the admission control, wait as told by the server
+            if response.status_code != 429 or retry == MAX_RETRIES:
+                break
+
+            try:
+                retry_after = float(response.headers.get("Retry-After", 1))
+
+            except ValueError:
+                retry_after = 1
+
+            retry_after = min(max(retry_after, 0), MAX_RETRY_AFTER)
+            _LOGGER.info(
+                "%s %s rejected, sent again in %.1f s",
+                self.name,
+                action,
+                retry_after,
+            )
+            time.sleep(retry_after)
+
+        _LOGGER.debug(
+            "Trace %s: %s %s took %.1f ms",
+            trace_id,
+            self.name,
+            action,
+            (time.perf_counter() - start) * 1000,
+        )
+        return response.content
 
     def stop(self):
         """Stop the rolling shutter."""
@@ -28,3 +147,12 @@ class RTSSomfyRollingShutter:
     def up(self):
         """Move the rolling shutter up."""
         return self._send_action(action="up")
+
+    def set_position(self, position):
+        """Move the rolling shutter to a position (0 closed, 100 open).
+
+        The server times the STOP, see positioning.py in rts_covers.
+        """
+        return self._send_action(
+            action=int(position), path="position", parameter="position"
+        )
@@ -3,33 +3,38 @@
 import re
 
 from somfy_frame_generator import (
-    frame_to_string,
-    generate_somfy_full_frame,
-    read_config_file,
+    Frame,
+    frame_airtime,
+    frame_repeats,
+    read_settings,
     shutter_id_and_counter,
     str_to_int,
 )
+from tracing import span
 
 
 def decode_json_commands(settings: str, recipe: str):
     """Decode a recipe from a json file."""
     commands = []
-    for shutter_command in read_config_file(settings)["Recipes"][recipe]:
+    for shutter_command in read_settings(settings)["Recipes"][recipe]:
         # Retrieve command, shutter counter and shutter's id.
         shutter_id, counter = shutter_id_and_counter(
             settings, shutter_command["shutter"]
         )
+        repeats = frame_repeats(
+            settings, shutter_command["shutter"], shutter_command["command"]
+        )
         commands.append(
             {
                 "command": shutter_command["command"],
                 "shutter": shutter_command["shutter"],
                 "counter": counter,
                 "shutter_id": shutter_id,
-                "frame": frame_to_string(
-                    generate_somfy_full_frame(
-                        shutter_command["command"], counter, shutter_id
-                    )
+                "frame": Frame(
+                    shutter_command["command"], counter, shutter_id, repeats
                 ),
+                "repeats": repeats,
+                "airtime": frame_airtime(repeats),
             }
         )
     return commands
@@ -64,6 +69,12 @@ def extract_arguments(arguments_str: str):
 
 
 def decode_str_commands(settings: str, commands: str):
+    """Decode a recipe from a string."""
+    with span("interpreter.decode", commands=commands):
+        return _decode_str_commands(settings, commands)
+
+
+def _decode_str_commands(settings: str, commands: str):
     """Decode a recipe from a string."""
     commands = commands.splitlines()
 
@@ -86,9 +97,8 @@ def decode_str_commands(settings: str, commands: str):
             if len(arguments) > 2:
                 counter = arguments[2]
 
-            frame = generate_somfy_full_frame(
-                arguments[1], counter, shutter_id
-            )
+            repeats = frame_repeats(settings, arguments[0], arguments[1])
+            frame = Frame(arguments[1], counter, shutter_id, repeats)
 
             decoded_commands.append(
                 {
@@ -97,8 +107,10 @@ def decode_str_commands(settings: str, commands: str):
                     "shutter_id": shutter_id,
                     "command": arguments[1],
                     "counter": counter,
-                    "frame": frame_to_string(frame),
+                    "frame": frame,
                     "shutter": arguments[0],
+                    "repeats": repeats,
+                    "airtime": frame_airtime(repeats),
                 }
             )
     return decoded_commands
@@ -0,0 +1,166 @@
+"""Learn the latency of the echoes of the remote and derive deadlines.
+
+The time from the write of a command to its echo is its airtime (and the
+airtime of the commands queued before it in the firmware), plus the
+latency of the USB link and of the firmware. This latency is recorded
+for each device and kind of command in a histogram, and the deadline of
+a new command is its expected airtime plus a high quantile (p99.9) of
+the latency, with a margin. A lost echo is then detected in about the
+time a normal command takes, instead of the fixed ECHO_TIMEOUT.
+
+The histograms forget the old samples gradually, so that the deadlines
+follow a link getting slower (the late echoes are recorded too).
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+
+# Maximum time to wait for an echo, besides the airtime (in seconds), also
+# used until enough echoes have been recorded
+ECHO_TIMEOUT = 10
+
+# Quantile of the latency used for the deadlines
+ECHO_QUANTILE = 0.999
+
+# The deadline is the quantile times DEADLINE_FACTOR plus DEADLINE_MARGIN
+# (in seconds)
+DEADLINE_FACTOR = 1.5
+DEADLINE_MARGIN = 0.05
+
+# Echoes to record before the deadlines are derived from the histogram
+MIN_SAMPLES = 50
+
+# Buckets of the histograms: up to 1 ms, then each 10 % wider than the
+# previous one (up to about 3 minutes)
+BUCKET_BASE = 0.001
+BUCKET_GROWTH = 1.1
+BUCKET_COUNT = 128
+
+# Weight of the past samples, multiplied by DECAY at each new sample (the
+# weight of a sample is halved after about 700 samples)
+DECAY = 0.999
+
+
+# The kinds of the commands that are not frames, by their first bytes
+COMMAND_KINDS = {
+    b"PING": "ping",
+    b"READY": "ready",
+    b"PULSE": "pulse",
+    b"TRAIN": "train",
+}
+
+
+def command_kind(payload: bytes) -> str:
+    """Return the kind of a command ("frame", "pulse", "train", "ping")."""
+    return COMMAND_KINDS.get(payload[:5].upper(), "frame")
+
+
+class LatencyHistogram:
+    """A histogram of latencies, with log-spaced buckets and decay."""
+
+    def __init__(self) -> None:
+        self.counts = [0.0] * BUCKET_COUNT
+        self.samples = 0
+        self._weight = 1.0
+
+    @staticmethod
+    def _bucket(latency: float) -> int:
+        if latency <= BUCKET_BASE:
+            return 0
+
+        return min(
+            BUCKET_COUNT - 1,
+            math.ceil(math.log(latency / BUCKET_BASE, BUCKET_GROWTH)),
+        )
+
+    def add(self, latency: float) -> None:
+        """Add a latency (in seconds)."""
+        # Rather than decaying every bucket, the new samples weigh more
+        self._weight /= DECAY
+        self.counts[self._bucket(latency)] += self._weight
+        self.samples += 1
+
+        if self._weight > 1e6:
+            self.counts = [count / self._weight for count in self.counts]
+            self._weight = 1.0
+
+    def quantile(self, quantile: float) -> float | None:
+        """Return the upper bound of the quantile (in seconds)."""
+        total = sum(self.counts)
+
+        if total == 0:
+            return None
+
+        cumulated = 0.0
+        for index, count in enumerate(self.counts):
+            cumulated += count
+
+            if cumulated >= quantile * total:
+                return BUCKET_BASE * BUCKET_GROWTH**index
+
+        return BUCKET_BASE * BUCKET_GROWTH ** (BUCKET_COUNT - 1)
+
+
+class EchoDeadlines:
+    """The echo latencies of each device and kind of command."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def record(self, device: str, kind: str, latency: float) -> None:
+        """Record the latency of an echo, besides the airtime."""
+        with self._lock:
+            self._histograms.setdefault(
+                (device, kind), LatencyHistogram()
+            ).add(max(0.0, latency))
+
+    def deadline(self, device: str, kind: str, airtime: float) -> float:
+        """Return the time to wait for the echo of a command.
+
+        Args:
+            device (str): The device (the remote).
+            kind (str): The kind of command (see command_kind()).
+            airtime (float): The airtime of the command and of the
+            commands queued before it (in seconds).
+
+        Returns:
+            float: The deadline (in seconds), at most ECHO_TIMEOUT plus
+            the airtime.
+        """
+        with self._lock:
+            histogram = self._histograms.get((device, kind))
+
+            if histogram is None or histogram.samples < MIN_SAMPLES:
+                return ECHO_TIMEOUT + airtime
+
+            latency = histogram.quantile(ECHO_QUANTILE)
+
+        return airtime + min(
+            ECHO_TIMEOUT, latency * DEADLINE_FACTOR + DEADLINE_MARGIN
+        )
+
+    def summary(self, device: str) -> dict:
+        """Return the latencies and the deadlines of a device (in ms)."""
+        with self._lock:
+            histograms = {
+                kind: histogram
+                for (_device, kind), histogram in self._histograms.items()
+                if _device == device
+            }
+
+        return {
+            kind: {
+                "samples": histogram.samples,
+                "p50_ms": histogram.quantile(0.5) * 1000,
+                "p999_ms": histogram.quantile(ECHO_QUANTILE) * 1000,
+                "deadline_ms": self.deadline(device, kind, 0) * 1000,
+            }
+            for kind, histogram in histograms.items()
+        }
+
+
+# The latencies are shared by the links (one per device)
+echo_deadlines = EchoDeadlines()
@@ -0,0 +1,308 @@
+"""Pipeline tagged commands on the serial link of the remote."""
+
+from __future__ import annotations
+
+import itertools
+import logging
+import threading
+import time
+
+from latency import ECHO_TIMEOUT, command_kind, echo_deadlines
+from tracing import span
+from uart import UART
+
+# Number of commands that can be in flight, the firmware queue holds 4
+# commands and its UART buffer (64 bytes) 2 more tagged frames
+DEFAULT_WINDOW = 3
+
+# Number of distinct tags ("#00" to "#FF")
+TAG_COUNT = 256
+
+# The prefixes of the tagged lines ("#00 " to "#FF "), encoded once
+TAG_PREFIXES = [f"#{tag:02X} ".encode("ascii") for tag in range(TAG_COUNT)]
+
+
+class PendingCommand:
+    """A tagged command waiting for its completion echo."""
+
+    def __init__(self, tag: str, payload: bytes, airtime: float = 0) -> None:
+        self.tag = tag
+        self.payload = payload
+        self.kind = command_kind(payload)
+        # Airtime of the command (then, of the commands queued before it
+        # too, see CommandLink.submit())
+        self.expected = airtime
+        self.response = None
+        self.sent_at = time.monotonic()
+        self._done = threading.Event()
+
+    def complete(self, response: bytes) -> None:
+        """Set the completion echo of the command."""
+        self.response = response
+        self._done.set()
+
+    def wait(self, timeout: float | None = None) -> bytes | None:
+        """Wait for the completion echo.
+
+        Returns:
+            The echoed line, or None if the timeout expired.
+        """
+        self._done.wait(timeout)
+        return self.response
+
+    @property
+    def succeeded(self) -> bool:
+        """Return True if the firmware echoed the command."""
+        return (
+            self.response is not None
+            and self.payload in self.response
+        )
+
+
+class CommandLink:
+    """Keep several tagged commands in flight on the serial link.
+
+    Each command is sent as "#<tag> <command>\\n". The firmware queues the
+    commands and echoes "#<tag> <command>" once each one is executed (or
+    "#<tag> ! <error>" on failure). A reader thread matches the echoes
+    with the pending commands, so the next commands are written while
+    the previous frames are still being transmitted.
+
+    The latency of the echoes is recorded (see latency.py) to derive the
+    time to wait for the next ones.
+    """
+
+    def __init__(
+        self,
+        remote: UART,
+        window: int = DEFAULT_WINDOW,
+        logger: logging.Logger | None = None,
+    ) -> None:
+        self.remote = remote
+        self.logger = logger or logging.getLogger(__name__)
+        self._window = threading.BoundedSemaphore(window)
+        self._lock = threading.Lock()
+        self._pending = {}
+        # The commands whose echo was not received in time, by tag
+        self._expired = {}
+        self._next_tag = 0
+        self._buffer = b""
+        self._reader = None
+        self._running = threading.Event()
+        # Time of the last line received from the firmware (epoch)
+        self.last_echo = None
+        self.device = str(getattr(remote, "vid_pid", "remote"))
+        self.deadlines = echo_deadlines
+
+    def start(self) -> None:
+        """Start the thread reading the echoes."""
+        if self._reader is not None:
+            return
+
+        self._running.set()
+        self._reader = threading.Thread(
+            target=self._read_loop, name="CommandLink reader", daemon=True
+        )
+        self._reader.start()
+
+    def stop(self) -> None:
+        """Stop the thread reading the echoes."""
+        self._running.clear()
+
+        if self._reader is not None:
+            self._reader.join()
+            self._reader = None
+
+    def in_flight(self) -> int:
+        """Return the number of commands waiting for their echo."""
+        with self._lock:
+            return len(self._pending)
+
+    def submit(
+        self,
+        payload: str | bytes,
+        timeout: float | None = None,
+        airtime: float = 0,
+    ) -> PendingCommand | None:
+        """Write a tagged command once a slot of the window is free.
+
+        Args:
+            payload (str | bytes): The command (frame or pulse), e.g. the
+            wire bytes of a `Frame`.
+            timeout (float, optional): The maximum time to wait for a slot.
+            airtime (float, optional): The RF airtime of the command (in
+            seconds). Defaults to 0.
+
+        Returns:
+            The pending command, or None if no slot was free in time or
+            the command could not be written.
+        """
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+
+        with span("link.window_wait", in_flight=self.in_flight()):
+            if not self._window.acquire(timeout=timeout):
+                return None
+
+        with self._lock:
+            # Skip the tags of commands that are still in flight
+            while f"{self._next_tag:02X}" in self._pending:
+                self._next_tag = (self._next_tag + 1) % TAG_COUNT
+
+            tag = f"{self._next_tag:02X}"
+            prefix = TAG_PREFIXES[self._next_tag]
+            self._next_tag = (self._next_tag + 1) % TAG_COUNT
+            self._expired.pop(tag, None)
+            pending = PendingCommand(tag, payload, airtime)
+
+            # The firmware executes the commands in order, after the
+            # expected end of those in flight (including those whose echo
+            # is late, they may still be executed)
+            pending.expected += max(
+                [
+                    command.sent_at + command.expected - pending.sent_at
+                    for command in itertools.chain(
+                        self._pending.values(), self._expired.values()
+                    )
+                ]
+                + [0]
+            )
+            self._pending[tag] = pending
+
+        line = b"".join((prefix, payload, b"\n"))
+
+        try:
+            written = self.remote.write(line, flush=True)
+
+        except BaseException:
+            # Free the slot of the window whatever happens to the port
+            self._forget(pending)
+            raise
+
+        if not written:
+            self._forget(pending)
+            return None
+
+        return pending
+
+    def send(
+        self,
+        payload: str | bytes,
+        timeout: float | None = None,
+        airtime: float = 0,
+    ) -> bytes | None:
+        """Send a command and wait for its completion echo.
+
+        Args:
+            payload (str | bytes): The command (frame or pulse).
+            timeout (float, optional): The maximum time to wait for the
+            echo. Defaults to the deadline learned from the previous
+            echoes (at most ECHO_TIMEOUT plus the airtime).
+            airtime (float, optional): The RF airtime of the command (in
+            seconds). Defaults to 0.
+
+        Returns:
+            The echoed line, or None if it was not received in time.
+        """
+        pending = self.submit(
+            payload,
+            ECHO_TIMEOUT + airtime if timeout is None else timeout,
+            airtime,
+        )
+
+        if pending is None:
+            return None
+
+        if timeout is None:
+            timeout = self.deadlines.deadline(
+                self.device, pending.kind, pending.expected
+            )
+
+        try:
+            with span(
+                "link.echo_wait", tag=pending.tag, deadline=timeout
+            ) as attributes:
+                response = pending.wait(timeout)
+                attributes["echoed"] = response is not None
+
+            if response is None:
+                with self._lock:
+                    self._expired[pending.tag] = pending
+
+            else:
+                self._record(pending)
+
+            return response
+
+        finally:
+            self._forget(pending)
+
+    def _record(self, pending: PendingCommand) -> None:
+        """Record the latency of an echo, besides the expected airtime."""
+        self.deadlines.record(
+            self.device,
+            pending.kind,
+            time.monotonic() - pending.sent_at - pending.expected,
+        )
+
+    def echo_latency(self) -> dict:
+        """Return the echo latencies and deadlines of the remote (in ms)."""
+        return self.deadlines.summary(self.device)
+
+    def _forget(self, pending: PendingCommand) -> None:
+        """Remove a command from the window."""
+        with self._lock:
+            if self._pending.get(pending.tag) is not pending:
+                return
+
+            del self._pending[pending.tag]
+
+        self._window.release()
+
+    def _read_loop(self) -> None:
+        """Read the serial port and dispatch the echoes."""
+        while self._running.is_set():
+            data = self.remote.read_available()
+
+            if data is None:
+                # The port is closed, wait for a reconnection
+                self._buffer = b""
+                time.sleep(0.1)
+                continue
+
+            self._buffer += data
+
+            *lines, self._buffer = self._buffer.split(b"\n")
+            for line in lines:
+                self._dispatch(line.rstrip(b"\r"))
+
+    def _dispatch(self, line: bytes) -> None:
+        """Complete the command matching the tag of an echoed line."""
+        self.last_echo = time.time()
+
+        if not line.startswith(b"#"):
+            if line:
+                self.logger.debug("Untagged line from remote: %s", line)
+            return
+
+        tag = line[1:3].decode("utf-8", "replace").upper()
+
+        with self._lock:
+            pending = self._pending.get(tag)
+            late = self._expired.pop(tag, None) if pending is None else None
+
+        # The deadlines follow the latency of the late echoes too
+        if late is not None:
+            self.logger.warning(
+                "Late echo (%.0f ms): %s",
+                (time.monotonic() - late.sent_at) * 1000,
+                line,
+            )
+            self._record(late)
+            return
+
+        if pending is None:
+            self.logger.debug("Unknown echo: %s", line)
+            return
+
+        pending.complete(line)
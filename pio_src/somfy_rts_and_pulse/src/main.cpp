@@ -7,6 +7,11 @@
 
 const uint16_t SYMBOL = 640;
 
+// Nombre de répétitions d'une trame (par défaut, et au maximum)
+// Number of repetitions of a frame (by default, and at most)
+const uint8_t FRAME_REPEATS = 2;
+const uint8_t MAX_REPEATS = 30;
+
 // Sortie pilotant l'émetteur à 433,42 MHz
 // Output pin controlling the 433.42 MHz emitter
 const uint8_t TX_PIN = 5;
@@ -14,6 +19,32 @@ const uint8_t TX_PIN = 5;
 String raw_command = "";
 String processed_command = "";
 byte frame[7];
+uint8_t frame_repeats = FRAME_REPEATS;
+
+// Table des impulsions en cours (indexée par numéro de pin)
+// Pulses in progress (indexed by pin number)
+const uint8_t PIN_COUNT = 20;
+bool pulse_active[PIN_COUNT];
+uint32_t pulse_start[PIN_COUNT];
+uint32_t pulse_duration[PIN_COUNT];
+
+// Table horaire du train d'impulsions en cours (un front par entrée)
+// Timetable of the pulse train in progress (one edge per entry)
+const uint8_t MAX_TRAIN_EDGES = 8;
+uint8_t train_pins[MAX_TRAIN_EDGES];  // Pin (bits 0-4) and level (bit 7)
+uint32_t train_times[MAX_TRAIN_EDGES]; // Since the start of the train (ms)
+uint8_t train_length = 0;
+uint8_t train_index = 0;
+uint32_t train_start;
+
+// File des commandes reçues ("#<tag> <commande>" ou "<commande>")
+// Queue of the received commands ("#<tag> <command>" or "<command>")
+const uint8_t QUEUE_SIZE = 4;
+const uint8_t LINE_SIZE = 64;
+String command_queue[QUEUE_SIZE];
+uint8_t queue_head = 0;
+uint8_t queue_length = 0;
+String line_buffer = "";
 
 // Liste des commandes des volets
 // Blinds commands list
@@ -66,24 +97,54 @@ byte char_to_byte(char char_byte);
 byte two_char_to_byte(char MSB, char LSB);
 void send_command(byte *frame, byte sync, uint8_t port_tx,
                   uint32_t symbol = SYMBOL);
-void send_frame(byte *frame, uint8_t tx_pin);
+void send_frame(byte *frame, uint8_t tx_pin, uint8_t repeats);
+void start_pulse(uint8_t pin, uint32_t duration);
+bool load_train(String edges);
+bool is_decimal(String value);
+void update_pulses();
+void read_serial();
 
 void setup() {
   // Start Serial link|Démarrage de la liaison série
   Serial.begin(115200);
+  line_buffer.reserve(LINE_SIZE);
+
+  // Tell the host that the commands can be sent (after a reset)
+  Serial.println("READY");
 }
 
 void loop() {
-  if (Serial.available()) {
-    // Read raw command
-    raw_command = Serial.readStringUntil('\n');
+  // End the pulses whose duration has elapsed
+  update_pulses();
+
+  // Move the received lines from the UART buffer to the command queue
+  read_serial();
+
+  if (queue_length > 0) {
+    raw_command = command_queue[queue_head];
+    queue_head = (queue_head + 1) % QUEUE_SIZE;
+    queue_length--;
+
+    // Extract the optional sequence tag ("#<tag> <command>")
+    String tag = "";
+    if (raw_command.startsWith("#") && raw_command.indexOf(' ') > 0) {
+      tag = raw_command.substring(0, raw_command.indexOf(' ') + 1);
+      raw_command = raw_command.substring(tag.length());
+    }
+
     processed_command = raw_command;
     processed_command.replace(" ", "");
     processed_command.toUpperCase();
     // Check frame size --> Should be 7 bytes (14 char)
 
     uint8_t valid_command = 0;
-    if (processed_command.startsWith("PULSE(") &&
+    // Answer the link checks and the handshake of the host
+    if (processed_command == "PING" || processed_command == "READY") {
+      Serial.println(tag + raw_command);
+      valid_command = 2;
+    }
+
+    else if (processed_command.startsWith("PULSE(") &&
         processed_command.endsWith(")")) {
       String command =
           processed_command.substring(6, processed_command.length() - 1);
@@ -93,17 +154,76 @@ void loop() {
 
       if (pulse_arguments[0] >= 2 && pulse_arguments[0] != TX_PIN &&
           pulse_arguments[0] <= 19) {
-        Serial.println(raw_command);
-        pinMode(pulse_arguments[0], OUTPUT);
-        digitalWrite(pulse_arguments[0], LOW);
-        digitalWrite(pulse_arguments[0], HIGH);
-        delay(pulse_arguments[1]);
-        digitalWrite(pulse_arguments[0], LOW);
+        // Acknowledge immediately, the pulse is ended by update_pulses()
+        Serial.println(tag + raw_command);
+        start_pulse(pulse_arguments[0], pulse_arguments[1]);
+        valid_command = 2;
+      }
+
+      else {
+        debug(tag + "! Error the pin is not available.");
+        valid_command = 3;
+      }
+    }
+
+    // Pulse train ("TRAIN<edge>...", 3 bytes per edge in hexadecimal)
+    else if (processed_command.startsWith("TRAIN")) {
+      if (train_index < train_length) {
+        debug(tag + "! Error a pulse train is running.");
+        valid_command = 3;
+      }
+
+      else if (load_train(processed_command.substring(5))) {
+        // Acknowledge immediately, the edges are set by update_pulses()
+        Serial.println(tag + raw_command);
+        train_start = millis();
+        update_pulses();
+        valid_command = 2;
+      }
+
+      else {
+        debug(tag + "! Error invalid pulse train.");
+        valid_command = 3;
+      }
+    }
+
+    // Optional number of repetitions ("<frame>:<repeats>")
+    else if (processed_command.indexOf(':') == 14 &&
+             processed_command.length() > 15) {
+      String suffix = processed_command.substring(15);
+      // toInt() returns 0 for a malformed number
+      long repeats = is_decimal(suffix) ? suffix.toInt() : -1;
+
+      if (repeats < 0) {
+        debug(tag + "! Error invalid number of repetitions.");
+        valid_command = 3;
+      }
+
+      else if (repeats <= MAX_REPEATS) {
+        frame_repeats = repeats;
+        processed_command = processed_command.substring(0, 14);
+        valid_command = 4;
+      }
+
+      else {
+        debug(tag + "! Error the number of repetitions is too large.");
+        valid_command = 3;
       }
-      valid_command = 2;
     }
 
     else if (processed_command.length() == 14) {
+      frame_repeats = FRAME_REPEATS;
+      valid_command = 4;
+    }
+
+    else {
+      debug(tag +
+            "! Error the frame should have a length of 14 characters (7 "
+            "bytes).");
+    }
+
+    // Decode the hexadecimal frame
+    if (valid_command == 4) {
       for (uint8_t i(0); i < 14; i++) {
         if (char_to_byte(processed_command.charAt(i)) == 0xFF) {
           debug("Error the frame does not only contain HEX characters.");
@@ -117,10 +237,6 @@ void loop() {
       valid_command = 1;
     }
 
-    else {
-      debug("Error the frame should have a length of 14 characters (7 bytes).");
-    }
-
     switch (valid_command) {
     case 0: // Invalid instruction
       //        Serial.println("Wrong number of arguments!");
@@ -131,14 +247,36 @@ void loop() {
     // Send a RAW RTS frame
     // Envoyer une trame RTS brute
     case 1: // Send RAW command
-      send_frame(frame, TX_PIN);
-      debug(raw_command);
+      send_frame(frame, TX_PIN, frame_repeats);
+      // Echo the command (and its tag) once the frame has been sent
+      debug(tag + raw_command);
       break;
 
-    // Send a pulse on a pin
-    // Envoie un impulsion sur une pin
-    case 2: // Pulse pin
+    // Send a pulse on a pin or a pulse train (or answer a ping)
+    // Envoie un impulsion sur une pin ou un train (ou répond à un ping)
+    case 2: // Pulse pin, pulse train or ping
       break;
+
+    // Invalid pulse (already reported)
+    case 3:
+      break;
+    }
+  }
+}
+
+void read_serial() {
+  while (Serial.available() && queue_length < QUEUE_SIZE) {
+    char character = Serial.read();
+
+    if (character == '\n') {
+      command_queue[(queue_head + queue_length) % QUEUE_SIZE] = line_buffer;
+      queue_length++;
+      line_buffer = "";
+    }
+
+    // Drop the lines that are too long to be a valid command
+    else if (character != '\r' && line_buffer.length() < LINE_SIZE) {
+      line_buffer += character;
     }
   }
 }
@@ -238,13 +376,102 @@ void send_command(byte *frame, byte sync, uint8_t port_tx, uint32_t symbol) {
   delayMicroseconds(30415);
 }
 
-void send_frame(byte *frame, uint8_t tx_pin) {
+void send_frame(byte *frame, uint8_t tx_pin, uint8_t repeats) {
   // Configure the port|Configuration du port
   DDRD = DDRD | (1 << TX_PIN);
 
   send_command(frame, 2, tx_pin);
 
-  for (uint8_t i = 0; i < 2; i++) {
+  for (uint8_t i = 0; i < repeats; i++) {
+    // Keep the pulses accurate to one repetition (~150 ms) during the burst
+    update_pulses();
+    // Queue the commands received during the burst before the UART buffer
+    // (64 bytes) overflows
+    read_serial();
     send_command(frame, 7, tx_pin);
   }
 }
+
+void start_pulse(uint8_t pin, uint32_t duration) {
+  pinMode(pin, OUTPUT);
+  digitalWrite(pin, HIGH);
+  pulse_start[pin] = millis();
+  pulse_duration[pin] = duration;
+  pulse_active[pin] = true;
+}
+
+bool is_decimal(String value) {
+  if (value.length() == 0 || value.length() > 9) {
+    return false;
+  }
+
+  for (uint8_t i = 0; i < value.length(); i++) {
+    if (!isDigit(value.charAt(i))) {
+      return false;
+    }
+  }
+
+  return true;
+}
+
+bool load_train(String edges) {
+  uint8_t length = edges.length() / 6;
+
+  if (edges.length() % 6 != 0 || length == 0 || length > MAX_TRAIN_EDGES) {
+    return false;
+  }
+
+  for (uint8_t i = 0; i < edges.length(); i++) {
+    if (char_to_byte(edges.charAt(i)) == 0xFF) {
+      return false;
+    }
+  }
+
+  uint32_t time = 0;
+  for (uint8_t i = 0; i < length; i++) {
+    uint8_t pin = two_char_to_byte(edges.charAt(6 * i),
+                                   edges.charAt(6 * i + 1));
+    uint8_t number = pin & 0x1F;
+
+    if (number < 2 || number == TX_PIN || number >= PIN_COUNT) {
+      return false;
+    }
+
+    // Delay since the previous edge (big-endian)
+    uint16_t delay_msb = two_char_to_byte(edges.charAt(6 * i + 2),
+                                          edges.charAt(6 * i + 3));
+    uint16_t delay_lsb = two_char_to_byte(edges.charAt(6 * i + 4),
+                                          edges.charAt(6 * i + 5));
+    time += (delay_msb << 8) | delay_lsb;
+    train_pins[i] = pin;
+    train_times[i] = time;
+  }
+
+  for (uint8_t i = 0; i < length; i++) {
+    pinMode(train_pins[i] & 0x1F, OUTPUT);
+  }
+
+  train_index = 0;
+  train_length = length;
+  return true;
+}
+
+void update_pulses() {
+  uint32_t now = millis();
+
+  // Set the edges of the pulse train that are due
+  while (train_index < train_length &&
+         now - train_start >= train_times[train_index]) {
+    digitalWrite(train_pins[train_index] & 0x1F,
+                 train_pins[train_index] & 0x80 ? HIGH : LOW);
+    train_index++;
+  }
+
+  for (uint8_t pin = 0; pin < PIN_COUNT; pin++) {
+    // The subtraction is safe when millis() overflows
+    if (pulse_active[pin] && now - pulse_start[pin] >= pulse_duration[pin]) {
+      digitalWrite(pin, LOW);
+      pulse_active[pin] = false;
+    }
+  }
+}
@@ -0,0 +1,436 @@
+"""Move the shutters to a position with a timed STOP.
+
+The covers do not report their position, it is estimated from the travel
+times of each shutter in the settings (in seconds, from fully closed to
+fully open and back):
+
+    "shutters": {"shutter 0": {"id": "0x000001",
+                               "travel_time": {"up": 21.5, "down": 20}}}
+
+The position is 0 when closed and 100 when open. Every command echoed by
+the remote updates the estimate, from the time at which the motor acted:
+the receiver acts at the end of the first frame of a burst, and the echo
+of the firmware comes at the end of the burst.
+
+To reach a position, the shutter is sent UP or DOWN, then STOP, timed so
+that the motor stops at the right time. STOP is sent ahead of this time
+by the measured latency from the decision to the start of the RF burst
+(queuing, serial write and parsing by the firmware), plus the airtime of
+the first frame. This latency is calibrated with pings (no RF), then
+learned from each STOP. The error between the planned and the achieved
+stop time is kept as a metric.
+"""
+
+from __future__ import annotations
+
+import collections
+import statistics
+import threading
+import time
+
+import somfy_frame_generator as frame_generator
+
+# The receivers act at the end of the first frame of a burst (in seconds)
+FIRST_FRAME_AIRTIME = frame_generator.frame_airtime(0)
+
+# The last part of a wait is spun for accuracy (in seconds)
+SPIN_TIME = 0.002
+
+# Number of latencies and stop errors kept
+LATENCY_SAMPLES = 200
+
+# Latencies assumed until the calibration (in seconds)
+DEFAULT_RF_START = 0.02
+DEFAULT_ECHO_DELAY = 0.005
+
+UP = frame_generator.COMMANDS["UP"]
+DOWN = frame_generator.COMMANDS["DOWN"]
+STOP = frame_generator.COMMANDS["STOP"]
+
+
+def travel_times(config_file_path: str, shutter_key: str) -> dict | None:
+    """Return the travel times of a shutter ({"up": s, "down": s}).
+
+    The "travel_time" of a shutter is either a number (both directions)
+    or {"up": ..., "down": ...}. None is returned if it is not set.
+    """
+    _config = frame_generator.read_settings(config_file_path)
+    _travel = _config["shutters"].get(shutter_key, {}).get("travel_time")
+
+    if _travel is None:
+        return None
+
+    if isinstance(_travel, (int, float)):
+        return {"up": float(_travel), "down": float(_travel)}
+
+    return {"up": float(_travel["up"]), "down": float(_travel["down"])}
+
+
+def sleep_until(deadline: float) -> None:
+    """Sleep until time.monotonic() reaches the deadline.
+
+    The end of the wait is spun, time.sleep() alone oversleeps by up to a
+    scheduler tick.
+    """
+    while True:
+        remaining = deadline - time.monotonic()
+
+        if remaining <= 0:
+            return
+
+        if remaining > SPIN_TIME:
+            time.sleep(remaining - SPIN_TIME)
+
+
+class LatencyModel:
+    """The recent samples of a latency (in seconds)."""
+
+    def __init__(self, default: float) -> None:
+        self.default = default
+        self._samples = collections.deque(maxlen=LATENCY_SAMPLES)
+
+    def add(self, sample: float) -> None:
+        """Add a sample."""
+        self._samples.append(sample)
+
+    def estimate(self) -> float:
+        """Return the median of the samples (the default if none)."""
+        if not self._samples:
+            return self.default
+
+        return statistics.median(self._samples)
+
+    def summary(self) -> dict:
+        """Return the number of samples and their percentiles (in ms)."""
+        samples = sorted(self._samples)
+
+        if not samples:
+            return {"count": 0, "default_ms": self.default * 1000}
+
+        return {
+            "count": len(samples),
+            "p50_ms": statistics.median(samples) * 1000,
+            "p95_ms": samples[int(len(samples) * 0.95) - 1] * 1000
+            if len(samples) >= 20
+            else samples[-1] * 1000,
+            "max_ms": samples[-1] * 1000,
+        }
+
+
+class PositionController:
+    """Estimate the positions of the shutters and move them to a position.
+
+    Args:
+        config_file_path (str): The path to the settings file.
+        send (callable): Send a command ({"name": ..., "action": ...}),
+        return True once the remote echoed it. The echoed commands must be
+        passed to `record()` (in the same thread).
+        ping (callable): Ping the firmware, return True if it answered.
+        logger (logging.Logger): The logger.
+        node_of (callable, optional): Return the node serving a shutter,
+        or None if it is served by the local remote.
+    """
+
+    def __init__(
+        self, config_file_path: str, send, ping, logger, node_of=None
+    ) -> None:
+        self.config_file_path = config_file_path
+        self.send = send
+        self.ping = ping
+        self.logger = logger
+        self.node_of = node_of or (lambda shutter: None)
+        # Decision to send STOP -> start of the RF burst
+        self.rf_start = LatencyModel(DEFAULT_RF_START)
+        # Echo of the firmware -> read by the host
+        self.echo_delay = LatencyModel(DEFAULT_ECHO_DELAY)
+        # Achieved - planned stop time of the timed STOPs
+        self.stop_errors = collections.deque(maxlen=LATENCY_SAMPLES)
+        self.version = 0
+        self._lock = threading.Lock()
+        self._states = {}
+        self._generations = collections.Counter()
+        self._cancelled = {}
+        self._local = threading.local()
+
+    def stop_lead(self) -> float:
+        """Return how long before the planned stop STOP must be sent."""
+        return self.rf_start.estimate() + FIRST_FRAME_AIRTIME
+
+    def _estimate(self, shutter: str, now: float) -> float | None:
+        """Return the estimated position of a shutter at a time."""
+        state = self._states.get(shutter)
+
+        if state is None or state["direction"] == 0:
+            return None if state is None else state["position"]
+
+        travel = travel_times(self.config_file_path, shutter)
+        if travel is None:
+            return None
+
+        direction = "up" if state["direction"] > 0 else "down"
+        moved = 100 * (now - state["since"]) / travel[direction]
+        end = 100 if state["direction"] > 0 else 0
+
+        # The motor stops by itself at the end of its travel
+        if state["position"] is None:
+            return end if moved >= 100 else None
+
+        return min(100, max(0, state["position"] + state["direction"] * moved))
+
+    def record(self, shutter: str, action: str, airtime: float) -> None:
+        """Update the estimate of a shutter with a command echoed now.
+
+        A command that was not sent by the controller cancels the timed
+        STOP planned for the shutter.
+
+        Args:
+            shutter (str): The name of the shutter.
+            action (str): The command.
+            airtime (float): The airtime of the burst (in seconds).
+        """
+        code = frame_generator.COMMANDS.get(str(action).upper())
+        if code not in (UP, DOWN, STOP):
+            return
+
+        # Without travel time, the end of a move is never known
+        if travel_times(self.config_file_path, shutter) is None:
+            return
+
+        # The motor acted at the end of the first frame of the burst
+        acted = (
+            time.monotonic()
+            - self.echo_delay.estimate()
+            - airtime
+            + FIRST_FRAME_AIRTIME
+        )
+
+        with self._lock:
+            if not getattr(self._local, "own", False):
+                self._cancel(shutter)
+
+            state = self._states.get(shutter, {"direction": 0})
+            position = self._estimate(shutter, acted)
+
+            if code == STOP and state["direction"] == 0:
+                # STOP (MY) moves an idle shutter to its favourite position
+                position = None
+
+            self._states[shutter] = {
+                "position": position,
+                "direction": {UP: 1, DOWN: -1, STOP: 0}[code],
+                "since": acted,
+            }
+            self.version += 1
+
+    def _cancel(self, shutter: str) -> None:
+        """Cancel the plan of a shutter (the lock must be held)."""
+        self._generations[shutter] += 1
+        cancelled = self._cancelled.pop(shutter, None)
+
+        if cancelled is not None:
+            cancelled.set()
+
+    def refresh(self) -> None:
+        """Mark the shutters that reached the end of their travel."""
+        now = time.monotonic()
+
+        with self._lock:
+            for shutter, state in self._states.items():
+                position = self._estimate(shutter, now)
+
+                if state["direction"] and position in (0, 100):
+                    state.update(position=position, direction=0)
+                    self.version += 1
+
+    def positions(self) -> dict:
+        """Return the estimated position and movement of each shutter."""
+        self.refresh()
+        now = time.monotonic()
+
+        with self._lock:
+            return {
+                shutter: {
+                    "position": None
+                    if self._estimate(shutter, now) is None
+                    else round(self._estimate(shutter, now)),
+                    "moving": {1: "up", -1: "down"}.get(state["direction"]),
+                }
+                for shutter, state in self._states.items()
+            }
+
+    def _send_own(self, shutter: str, action: str) -> bool:
+        self._local.own = True
+
+        try:
+            return self.send({"name": shutter, "action": action})
+
+        finally:
+            self._local.own = False
+
+    def set_position(self, shutter: str, target: int) -> dict:
+        """Move a shutter to a position (in the background).
+
+        Returns:
+            dict: The plan (action, from, to and duration of the move).
+
+        Raises:
+            ValueError: If the shutter is served by another node, has no
+            travel time, or if its position is unknown and the target is
+            not an end.
+        """
+        # The timed STOP must be sent by the node serving the shutter
+        node = self.node_of(shutter)
+        if node is not None:
+            raise ValueError(
+                f"{shutter} is served by the node {node}, send the position"
+                " to this node."
+            )
+
+        travel = travel_times(self.config_file_path, shutter)
+        if travel is None:
+            raise ValueError(f"The travel_time of {shutter} is not set.")
+
+        target = min(100, max(0, int(target)))
+
+        with self._lock:
+            current = self._estimate(shutter, time.monotonic())
+
+            if current is None and target not in (0, 100):
+                raise ValueError(
+                    f"The position of {shutter} is unknown, open or close"
+                    " it first."
+                )
+
+            self._cancel(shutter)
+            generation = self._generations[shutter]
+            cancelled = self._cancelled[shutter] = threading.Event()
+
+        action = "up" if current is None or target > current else "down"
+        plan = {
+            "shutter": shutter,
+            "from": None if current is None else round(current, 1),
+            "to": target,
+        }
+
+        # The motor stops by itself at the ends, else a STOP is timed
+        if target in (0, 100):
+            action = "up" if target == 100 else "down"
+            duration = None
+
+        elif abs(target - current) < 1:
+            return {**plan, "action": None, "duration": 0}
+
+        else:
+            duration = abs(target - current) / 100 * travel[action]
+
+        threading.Thread(
+            target=self._move,
+            args=(shutter, action, duration, generation, cancelled),
+            name=f"Position {shutter}",
+            daemon=True,
+        ).start()
+
+        return {**plan, "action": action, "duration": duration}
+
+    def _move(
+        self,
+        shutter: str,
+        action: str,
+        duration: float | None,
+        generation: int,
+        cancelled: threading.Event,
+    ) -> None:
+        """Send UP or DOWN, then STOP after duration (if not None)."""
+        if not self._send_own(shutter, action) or duration is None:
+            return
+
+        with self._lock:
+            if self._generations[shutter] != generation:
+                return
+
+            planned_stop = self._states[shutter]["since"] + duration
+
+        send_at = planned_stop - self.stop_lead()
+
+        # Wait coarsely (the plan can be cancelled), then precisely
+        if cancelled.wait(max(0, send_at - time.monotonic() - 0.05)):
+            return
+        sleep_until(send_at)
+
+        with self._lock:
+            if self._generations[shutter] != generation:
+                return
+
+        stop_airtime = frame_generator.frame_airtime(
+            frame_generator.frame_repeats(
+                self.config_file_path, shutter, "STOP"
+            )
+        )
+        sent = time.monotonic()
+
+        if not self._send_own(shutter, "stop"):
+            self.logger.error("The timed STOP of %s failed.", shutter)
+            return
+
+        # Learn the latency from the decision to the RF burst
+        burst_start = time.monotonic() - self.echo_delay.estimate()
+        burst_start -= stop_airtime
+        self.rf_start.add(burst_start - sent)
+
+        error = burst_start + FIRST_FRAME_AIRTIME - planned_stop
+        self.stop_errors.append(error)
+        self.logger.info(
+            "%s stopped %+.1f ms from the planned time.", shutter, error * 1000
+        )
+
+    def calibrate(self, samples: int = 20) -> dict:
+        """Measure the latency of the serial link with pings.
+
+        Half of the round trip is used as the latency in each direction,
+        the latency of the STOPs is then refined by each timed STOP.
+
+        Returns:
+            dict: The round trips and the resulting STOP lead (in ms).
+        """
+        round_trips = []
+
+        for _ in range(samples):
+            start = time.monotonic()
+
+            if self.ping():
+                round_trips.append(time.monotonic() - start)
+
+        for round_trip in round_trips:
+            self.echo_delay.add(round_trip / 2)
+            self.rf_start.add(round_trip / 2)
+
+        round_trips.sort()
+
+        return {
+            "samples": len(round_trips),
+            "round_trip_p50_ms": statistics.median(round_trips) * 1000
+            if round_trips
+            else None,
+            "round_trip_max_ms": round_trips[-1] * 1000
+            if round_trips
+            else None,
+            "stop_lead_ms": self.stop_lead() * 1000,
+        }
+
+    def metrics(self) -> dict:
+        """Return the latencies and the achieved STOP timing errors."""
+        errors = sorted(abs(error) for error in self.stop_errors)
+
+        return {
+            "stop_lead_ms": self.stop_lead() * 1000,
+            "rf_start": self.rf_start.summary(),
+            "echo_delay": self.echo_delay.summary(),
+            "stop_error": {
+                "count": len(errors),
+                "last_ms": self.stop_errors[-1] * 1000 if errors else None,
+                "mean_abs_ms": statistics.fmean(errors) * 1000
+                if errors
+                else None,
+                "max_abs_ms": errors[-1] * 1000 if errors else None,
+            },
+        }
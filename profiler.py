@@ -0,0 +1,139 @@
+"""Sample the stacks of all the threads of the running service.
+
+The sampler reads the current frame of every thread (the HTTP workers,
+the reader of the serial link, the supervisor, the scheduler, ...) at a
+fixed interval with `sys._current_frames()`, without any tracing hook, so
+the service is only slowed down while a sample is taken. The stacks are
+counted in the "collapsed" format of flamegraph.pl, one line per stack:
+
+    thread;outer (file.py:12);inner (file.py:34) <number of samples>
+
+The output can be opened as is in https://www.speedscope.app or turned
+into an SVG with `flamegraph.pl`.
+"""
+
+from __future__ import annotations
+
+import collections
+import hmac
+import os
+import sys
+import threading
+import time
+
+import somfy_frame_generator as frame_generator
+
+# Limits of a profile
+MAX_DURATION = 60
+MIN_INTERVAL = 0.001
+
+DEFAULT_INTERVAL = 0.01
+
+
+def profiler_token(config_file_path: str) -> str | None:
+    """Return the token of the profiler, or None if it is disabled."""
+    _config = frame_generator.read_settings(config_file_path)
+    return _config.get("Debug", {}).get("profiler_token") or None
+
+
+def is_authorized(token: str | None, authorization: str | None) -> bool:
+    """Check the "Authorization: Bearer <token>" header of a request."""
+    if not token or not authorization:
+        return False
+
+    scheme, _, credentials = authorization.partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(
+        credentials.strip().encode("utf-8"), token.encode("utf-8")
+    )
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:"
+        f"{frame.f_lineno})"
+    )
+
+
+def _stack(frame) -> list[str]:
+    """Return the names of the frames of a stack, the outermost first."""
+    stack = []
+
+    while frame is not None:
+        stack.append(_frame_name(frame))
+        frame = frame.f_back
+
+    stack.reverse()
+    return stack
+
+
+class Sampler:
+    """Sample the stacks of the threads, one profile at a time."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+
+    @property
+    def busy(self) -> bool:
+        """Return True if a profile is being taken."""
+        return self._lock.locked()
+
+    def sample(
+        self, duration: float, interval: float = DEFAULT_INTERVAL
+    ) -> collections.Counter | None:
+        """Sample the threads for duration seconds.
+
+        Args:
+            duration (float): The duration of the profile (in seconds).
+            interval (float, optional): The time between two samples (in
+            seconds). Defaults to DEFAULT_INTERVAL.
+
+        Returns:
+            collections.Counter: The number of samples of each stack
+            (";"-joined, the name of the thread first), or None if another
+            profile is being taken.
+        """
+        duration = min(max(duration, 0), MAX_DURATION)
+        interval = max(interval, MIN_INTERVAL)
+
+        if not self._lock.acquire(blocking=False):
+            return None
+
+        try:
+            return self._sample(duration, interval)
+
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def _sample(duration: float, interval: float) -> collections.Counter:
+        counts = collections.Counter()
+        own_ident = threading.get_ident()
+        deadline = time.monotonic() + duration
+        next_sample = time.monotonic()
+
+        while next_sample < deadline:
+            names = {
+                thread.ident: thread.name for thread in threading.enumerate()
+            }
+
+            # pylint: disable-next=protected-access
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+
+                stack = [names.get(ident, f"thread-{ident}")]
+                stack.extend(_stack(frame))
+                counts[";".join(name.replace(";", ":") for name in stack)] += 1
+
+            next_sample += interval
+            time.sleep(max(0, next_sample - time.monotonic()))
+
+        return counts
+
+
+def collapse(counts: collections.Counter) -> str:
+    """Return the samples in the collapsed format of flamegraph.pl."""
+    return "".join(
+        f"{stack} {count}\n" for stack, count in sorted(counts.items())
+    )
@@ -0,0 +1,228 @@
+"""Track the pulses running on the GPIO pins of the Arduino.
+
+A pulse train is a timed sequence of pulses on one or several pins, e.g.
+a double tap on a relay, described as "<pin>:<start>:<duration>" pulses
+separated by commas (in milliseconds, from the start of the train):
+
+    7:0:200,7:400:200,8:0:1000
+
+It is compiled on the host into a single serial command, the timetable of
+its edges, executed by the firmware on its own:
+
+    TRAIN<edge><edge>...
+
+Each edge is 3 bytes in hexadecimal: the pin (bits 0-4) and its level
+(bit 7), then the delay since the previous edge (2 bytes, big-endian).
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+
+# Output pin controlling the 433.42 MHz emitter (see TX_PIN in main.cpp)
+TX_PIN = 5
+
+# Pins accepted by the firmware for a pulse
+PULSE_PINS = tuple(pin for pin in range(2, 20) if pin != TX_PIN)
+
+# Edges in the timetable of the firmware (see MAX_TRAIN_EDGES in main.cpp)
+MAX_TRAIN_EDGES = 8
+
+# Maximum delay between two edges of a train (in milliseconds)
+MAX_EDGE_DELAY = 0xFFFF
+
+# Key of the pulse train in the PulseTracker (one train at a time)
+TRAIN = "train"
+
+
+def validate_pulse(pin: int, delay: int) -> None:
+    """Check that a pulse can be executed by the firmware.
+
+    Args:
+        pin (int): The pin number.
+        delay (int): The duration of the pulse in milliseconds.
+
+    Raises:
+        ValueError: If the pin or the delay is not valid.
+    """
+    if pin not in PULSE_PINS:
+        raise ValueError(
+            f"Invalid pin ({pin}), valid pins are {list(PULSE_PINS)}."
+        )
+
+    if not 0 <= delay < 2**32:
+        raise ValueError(f"Invalid delay ({delay} ms).")
+
+
+def parse_train(description: str) -> list[tuple[int, int, int]]:
+    """Parse the description of a pulse train.
+
+    Args:
+        description (str): The pulses, "<pin>:<start>:<duration>"
+        separated by commas (in milliseconds).
+
+    Returns:
+        list: The (pin, start, duration) of the pulses.
+
+    Raises:
+        ValueError: If the description is not valid.
+    """
+    pulses = []
+
+    for pulse in description.split(","):
+        try:
+            pin, start, duration = (int(value) for value in pulse.split(":"))
+
+        except ValueError as error:
+            raise ValueError(
+                f"Invalid pulse ({pulse.strip()}), use"
+                " <pin>:<start>:<duration>."
+            ) from error
+
+        pulses.append((pin, start, duration))
+
+    return pulses
+
+
+def compile_train(pulses: list[tuple[int, int, int]]) -> str:
+    """Compile the pulses of a train into the serial command.
+
+    The pulses of a pin must not overlap. They can follow each other
+    (the end of a pulse is the start of the next one), the falling edge
+    is then set before the rising edge.
+
+    Args:
+        pulses (list): The (pin, start, duration) of the pulses.
+
+    Returns:
+        str: The command ("TRAIN" followed by the edges).
+
+    Raises:
+        ValueError: If the train cannot be executed by the firmware.
+    """
+    edges = []
+
+    for pin, start, duration in pulses:
+        validate_pulse(pin, duration)
+
+        if start < 0 or duration <= 0:
+            raise ValueError(
+                f"Invalid pulse on pin {pin} ({start} ms, {duration} ms)."
+            )
+
+        edges += [(start, 1, pin), (start + duration, 0, pin)]
+
+    if not edges or len(edges) > MAX_TRAIN_EDGES:
+        raise ValueError(
+            f"A train has 1 to {MAX_TRAIN_EDGES // 2} pulses"
+            f" ({len(pulses)} given)."
+        )
+
+    ends = {}
+    for pin, start, duration in sorted(pulses, key=lambda pulse: pulse[1]):
+        if start < ends.get(pin, 0):
+            raise ValueError(f"The pulses on pin {pin} overlap.")
+
+        ends[pin] = start + duration
+
+    command = "TRAIN"
+    previous = 0
+
+    # The falling edges go first when several edges are simultaneous
+    for time_ms, level, pin in sorted(edges):
+        if time_ms - previous > MAX_EDGE_DELAY:
+            raise ValueError(
+                f"The edges are more than {MAX_EDGE_DELAY} ms apart."
+            )
+
+        command += f"{level << 7 | pin:02X}{time_ms - previous:04X}"
+        previous = time_ms
+
+    return command
+
+
+def train_ends(pulses: list[tuple[int, int, int]]) -> dict:
+    """Return the end of the train on each pin, and of the whole train.
+
+    Returns:
+        dict: The end (in milliseconds) by pin, and by TRAIN.
+    """
+    ends = {}
+
+    for pin, start, duration in pulses:
+        ends[pin] = max(ends.get(pin, 0), start + duration)
+
+    ends[TRAIN] = max(ends.values())
+
+    return ends
+
+
+class PulseTracker:
+    """Track the end of the pulses started on the Arduino.
+
+    The firmware acknowledges a pulse immediately and ends it on its own,
+    so the host only has to know when a pin is free again. A pin is
+    claimed with `acquire()`, then marked as pulsing with `start()` once
+    the firmware has acknowledged the pulse. `release()` frees a pin
+    claimed for a pulse that has not been started. The firmware runs one
+    pulse train at a time, the train itself is tracked as the TRAIN pin.
+    """
+
+    def __init__(self) -> None:
+        self._condition = threading.Condition()
+        self._ends = {}
+
+    def remaining(self, pin: int | str) -> float:
+        """Return the remaining duration of the pulse on a pin in seconds."""
+        with self._condition:
+            return max(self._ends.get(pin, 0) - time.monotonic(), 0)
+
+    def acquire(self, pin: int | str, timeout: float | None = None) -> bool:
+        """Wait for the pulse running on a pin to end, then claim the pin.
+
+        Args:
+            pin (int | str): The pin number (or TRAIN).
+            timeout (float, optional): The maximum time to wait in seconds.
+            Defaults to None (wait forever).
+
+        Returns:
+            bool: True if the pin has been claimed, else, False.
+        """
+        deadline = math.inf if timeout is None else time.monotonic() + timeout
+
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                remaining = self._ends.get(pin, 0) - now
+
+                if remaining <= 0:
+                    break
+
+                if now >= deadline:
+                    return False
+
+                self._condition.wait(min(remaining, deadline - now))
+
+            # Claimed until the firmware acknowledges the pulse
+            self._ends[pin] = math.inf
+            return True
+
+    def start(self, pin: int | str, delay: int) -> None:
+        """Record that the firmware started a pulse on a claimed pin.
+
+        Args:
+            pin (int | str): The pin number (or TRAIN).
+            delay (int): The duration of the pulse in milliseconds.
+        """
+        with self._condition:
+            self._ends[pin] = time.monotonic() + delay / 1000
+            self._condition.notify_all()
+
+    def release(self, pin: int | str) -> None:
+        """Free a claimed pin if no pulse has been started on it."""
+        with self._condition:
+            if self._ends.get(pin) == math.inf:
+                del self._ends[pin]
+                self._condition.notify_all()
@@ -0,0 +1,202 @@
+"""Forward the commands of the shutters served by other rts_covers nodes.
+
+Each node drives the shutters in the RF range of its own Arduino. In the
+settings of the router, a shutter served by another node has a "node",
+the name of an entry of "Nodes":
+
+    "Nodes": {"garage": {"host": "192.168.1.20", "port": 4242}},
+    "shutters": {"garage door": {"node": "garage"}}
+
+The commands of these shutters are forwarded to the node over persistent
+(keep-alive) HTTP connections, so the clients only need to know the
+router.
+"""
+
+from __future__ import annotations
+
+import http.client
+import select
+import threading
+from urllib.parse import urlencode
+
+import somfy_frame_generator as frame_generator
+from tracing import current_trace_id, span
+
+# Time to wait for the answer of a node (in seconds). A node tries a
+# command up to 10 times, each try waiting up to about 12 s for the echo
+# of its remote (ECHO_TIMEOUT and the airtime), then up to 4 * try + 2 s
+# for the reconnection of the remote
+FORWARD_TIMEOUT = 330
+
+# Idle connections kept open to each node
+MAX_IDLE_CONNECTIONS = 4
+
+
+class NodeUnreachable(Exception):
+    """A node could not be reached."""
+
+
+def _is_dropped(connection: http.client.HTTPConnection) -> bool:
+    """Return True if an idle connection was closed by the node.
+
+    An idle keep-alive socket is readable only if the node closed it (or
+    sent unexpected data), in both cases it cannot be reused.
+    """
+    if connection.sock is None:
+        return True
+
+    try:
+        return bool(select.select([connection.sock], [], [], 0)[0])
+
+    except (OSError, ValueError):
+        return True
+
+
+class NodeClient:
+    """A pool of keep-alive HTTP connections to a node."""
+
+    def __init__(
+        self, host: str, port: int, timeout: float = FORWARD_TIMEOUT
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._idle = []
+
+    def _connection(self) -> http.client.HTTPConnection:
+        """Return an idle connection still open, or a new one."""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+
+                connection = self._idle.pop()
+
+            if not _is_dropped(connection):
+                return connection
+
+            connection.close()
+
+        return http.client.HTTPConnection(
+            self.host, self.port, timeout=self.timeout
+        )
+
+    def _release(self, connection: http.client.HTTPConnection) -> None:
+        with self._lock:
+            if len(self._idle) < MAX_IDLE_CONNECTIONS:
+                self._idle.append(connection)
+                return
+
+        connection.close()
+
+    def request(
+        self, method: str, path: str, headers: dict | None = None
+    ) -> tuple[int, bytes, dict]:
+        """Send a request to the node.
+
+        The idle connections closed by the node in the meantime are not
+        reused. A request that fails once written is not sent again, the
+        commands are not idempotent.
+
+        Returns:
+            tuple: The status, the body and the headers of the response.
+
+        Raises:
+            NodeUnreachable: If the node could not be reached.
+        """
+        connection = self._connection()
+
+        try:
+            connection.request(method, path, headers=headers or {})
+            response = connection.getresponse()
+            body = response.read()
+
+        except (OSError, http.client.HTTPException) as error:
+            connection.close()
+            raise NodeUnreachable(
+                f"{self.host}:{self.port} ({error})"
+            ) from error
+
+        if response.will_close:
+            connection.close()
+
+        else:
+            self._release(connection)
+
+        return response.status, body, dict(response.getheaders())
+
+    def close(self) -> None:
+        """Close the idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+
+        for connection in idle:
+            connection.close()
+
+
+class Router:
+    """Find the node of each shutter and forward its commands."""
+
+    def __init__(self, config_file_path: str) -> None:
+        self.config_file_path = config_file_path
+        self._lock = threading.Lock()
+        self._clients = {}
+
+    def node_of(self, parameters: dict) -> str | None:
+        """Return the node serving a command, or None if it is local."""
+        if "name" not in parameters:
+            return None
+
+        _config = frame_generator.read_settings(self.config_file_path)
+        _shutter = _config["shutters"].get(parameters["name"], {})
+
+        return _shutter.get("node")
+
+    def _client(self, node: str) -> NodeClient:
+        _config = frame_generator.read_settings(self.config_file_path)
+
+        try:
+            _node = _config["Nodes"][node]
+
+        except KeyError as error:
+            raise NodeUnreachable(f"Unknown node ({node}).") from error
+
+        key = (_node["host"], int(_node.get("port", 4242)))
+
+        with self._lock:
+            if key not in self._clients:
+                self._clients[key] = NodeClient(*key)
+
+            return self._clients[key]
+
+    def forward(
+        self, node: str, parameters: dict, path: str = "/"
+    ) -> tuple[int, bytes]:
+        """Forward a command to a node (to the route `path`).
+
+        Returns:
+            tuple: The status and the body of the answer of the node.
+
+        Raises:
+            NodeUnreachable: If the node could not be reached.
+        """
+        headers = {}
+        if current_trace_id() is not None:
+            headers["X-Trace-Id"] = current_trace_id()
+
+        with span("router.forward", node=node) as attributes:
+            status, body, _ = self._client(node).request(
+                "GET", f"{path}?{urlencode(parameters)}", headers
+            )
+            attributes["status"] = status
+
+        return status, body
+
+    def close(self) -> None:
+        """Close the connections to the nodes."""
+        with self._lock:
+            clients = list(self._clients.values())
+
+        for client in clients:
+            client.close()
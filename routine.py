@@ -20,9 +20,7 @@ import daemon
 from systemd import journal
 
 import somfy_frame_generator as frame_generator
-from uart import UART
-
-from flask_route import web_app
+from service import create_config
 
 SETTINGS_FILE = os.path.join(os.path.dirname(__file__), "settings.json")
 
@@ -56,7 +54,14 @@ def display_settings(current_logger, config_file_path):
 
     # Read each counter value or create counter file
     counters_paths = []
-    for _, conf in _settings["shutters"].items():
+    for name, conf in _settings["shutters"].items():
+        # The shutters served by another node have their counter there
+        if "id" not in conf:
+            current_logger.info(
+                "%s is served by the node %s.", name, conf.get("node")
+            )
+            continue
+
         # int(conf["id"], 16)
         counter_path = os.path.join(counters_root, f"{conf['id']}.txt")
         counters_paths.append(counter_path)
@@ -134,34 +139,36 @@ def main():
     with context:
         display_settings(logger, SETTINGS_FILE)
 
-        # Initialize the remote
-        logger.info("Initialize remote (UART link).")
-
         port = settings["HTTP"]["port"]
-        vid_sr = settings["UART"]["VID_SR"]
-        bauderate = settings["UART"]["SPEED"]
-        timeout = 0.1
-        mocking = settings["Test"]["remote_mocking"]
-
-        logger.debug("vid_sr = %s", vid_sr)
-        logger.debug("bauderate = %s", bauderate)
-        logger.debug("timeout = %s", timeout)
-        logger.debug("mocking = %s", mocking)
+        backend = settings["HTTP"].get("backend", "flask")
+        app_config = create_config(SETTINGS_FILE, logger)
+
+        # Compact binary commands for the wall switches and the scripts
+        binary = settings.get("Binary", {})
+        if binary.get("enable", False):
+            # pylint: disable-next=import-outside-toplevel
+            from command_listener import start
+
+            logger.info(
+                "Start binary command listener on port %s...",
+                binary.get("port", 4243),
+            )
+            start(app_config, port=binary.get("port", 4243), host="0.0.0.0")
 
-        remote = UART(vid_sr, bauderate, timeout, mocking)
+        if backend == "asyncio":
+            # Lighter server, Flask is not even imported
+            # pylint: disable-next=import-outside-toplevel
+            from embedded_server import serve
 
-        if settings["Test"]["remote_mocking"]:
-            logger.debug("The remote is being mocked.")
+            logger.info("Start asyncio server on port %s...", port)
+            serve(app_config, port=port, host="0.0.0.0")
+            return
 
-        else:
-            if not remote.connect(2):
-                logger.error("Could not connect to the remote.")
-                logger.error("Will try again on request.")
+        # pylint: disable-next=import-outside-toplevel
+        from flask_route import web_app
 
         # Save the logger and the remote in the app context
-        web_app.config["LOGGER"] = logger
-        web_app.config["REMOTE"] = remote
-        web_app.config["SETTINGS_FILE"] = SETTINGS_FILE
+        web_app.config.update(app_config)
 
         logger.info("Start flask server on port %s...", port)
         web_app.run(port=port, host="0.0.0.0")
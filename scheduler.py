@@ -0,0 +1,428 @@
+"""Schedule commands and recipes at given times."""
+
+from __future__ import annotations
+
+import datetime
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Callable
+
+import somfy_frame_generator as frame_generator
+
+# Fire the one-shot entries missed while the service was down, if they
+# are not older than this (in seconds)
+MISFIRE_GRACE = 300
+
+
+def schedule_path(config_file_path: str) -> str:
+    """Return the path to the schedule file."""
+    _config = frame_generator.read_settings(config_file_path)
+    _schedule_path = _config.get("schedule_path", "./schedule.json")
+
+    if not os.path.isabs(_schedule_path):
+        _schedule_path = os.path.join(
+            os.path.dirname(config_file_path), _schedule_path.replace("./", "")
+        )
+
+    return _schedule_path
+
+
+def command_airtime(command: dict, config_file_path: str) -> float:
+    """Return the RF airtime of a scheduled command in seconds.
+
+    Raises:
+        ValueError: If the recipe or the group of the command is unknown.
+    """
+    if "pin" in command or "train" in command:
+        return 0
+
+    _config = frame_generator.read_settings(config_file_path)
+
+    if "recipe" in command:
+        recipe = _config.get("Recipes", {}).get(command["recipe"])
+
+        if recipe is None:
+            raise ValueError(f"Unknown recipe ({command['recipe']}).")
+
+        steps = [(step["shutter"], step["command"]) for step in recipe]
+
+    elif "group" in command:
+        group = _config.get("Groups", {}).get(command["group"])
+
+        if group is None:
+            raise ValueError(f"Unknown group ({command['group']}).")
+
+        steps = [(name, command["action"]) for name in group]
+
+    else:
+        steps = [(command["name"], command["action"])]
+
+    return sum(
+        frame_generator.frame_airtime(
+            frame_generator.frame_repeats(config_file_path, name, action)
+        )
+        for name, action in steps
+    )
+
+
+def _parse_time_of_day(time_of_day: str) -> datetime.time:
+    """Parse a "HH:MM" or "HH:MM:SS" string."""
+    try:
+        return datetime.time.fromisoformat(time_of_day)
+
+    except (TypeError, ValueError) as error:
+        raise ValueError(
+            f"Invalid time ({time_of_day}), use HH:MM or HH:MM:SS."
+        ) from error
+
+
+def _parse_timestamp(moment) -> float:
+    """Parse an epoch timestamp or an ISO 8601 date and time."""
+    if isinstance(moment, (int, float)):
+        return float(moment)
+
+    try:
+        return datetime.datetime.fromisoformat(moment).timestamp()
+
+    except (TypeError, ValueError) as error:
+        raise ValueError(
+            f"Invalid date ({moment}), use a timestamp or ISO 8601."
+        ) from error
+
+
+def validate_entry(entry: dict) -> dict:
+    """Check a schedule entry and return a normalized copy.
+
+    An entry contains a "command", either {"name": ..., "action": ...},
+    {"pin": ..., "delay": ...}, {"train": ...}, {"group": ..., "action": ...}
+    or {"recipe": ...}, and either "at" (a timestamp or an ISO 8601 date,
+    fired once) or "time" ("HH:MM", fired every day, or only on the
+    "weekdays" listed, 0 being Monday).
+
+    Raises:
+        ValueError: If the entry is not valid.
+    """
+    command = entry.get("command")
+
+    if not isinstance(command, dict) or not (
+        {"name", "action"} <= command.keys()
+        or {"pin", "delay"} <= command.keys()
+        or "train" in command
+        or {"group", "action"} <= command.keys()
+        or "recipe" in command
+    ):
+        raise ValueError(
+            "The command must contain a name and an action, a pin and a"
+            " delay, a pulse train, a group and an action, or a recipe."
+        )
+
+    if (
+        "action" in command
+        and str(command["action"]).upper() not in frame_generator.COMMANDS
+    ):
+        raise ValueError(f"Invalid action ({command['action']}).")
+
+    if ("at" in entry) == ("time" in entry):
+        raise ValueError("The entry must contain either `at` or `time`.")
+
+    normalized = {
+        "id": str(entry.get("id") or uuid.uuid4().hex[:8]),
+        "command": dict(command),
+    }
+
+    if "at" in entry:
+        normalized["at"] = _parse_timestamp(entry["at"])
+
+    else:
+        _parse_time_of_day(entry["time"])
+        normalized["time"] = entry["time"]
+
+        weekdays = entry.get("weekdays", list(range(7)))
+        if (
+            not isinstance(weekdays, list)
+            or not weekdays
+            or not all(
+                isinstance(day, int) and 0 <= day <= 6 for day in weekdays
+            )
+        ):
+            raise ValueError(
+                "The weekdays must be a list of days between 0 and 6."
+            )
+
+        normalized["weekdays"] = sorted(set(weekdays))
+
+    return normalized
+
+
+def next_fire_time(entry: dict, after: float) -> float | None:
+    """Return the next time an entry must be fired, strictly after `after`.
+
+    Returns:
+        float | None: The timestamp, or None if the entry will not fire.
+    """
+    if "at" in entry:
+        return entry["at"] if entry["at"] > after else None
+
+    time_of_day = _parse_time_of_day(entry["time"])
+    day = datetime.date.fromtimestamp(after)
+
+    # The next allowed weekday is at most 7 days later
+    for _ in range(8):
+        if day.weekday() in entry["weekdays"]:
+            moment = datetime.datetime.combine(day, time_of_day).timestamp()
+
+            if moment > after:
+                return moment
+
+        day += datetime.timedelta(days=1)
+
+    return None
+
+
+class Scheduler:
+    """Fire time-triggered commands and recipes.
+
+    The next fire times are kept in a heap, so the scheduler thread sleeps
+    until the earliest one and adding or removing an entry costs
+    O(log n). Removed entries are dropped lazily when they reach the top
+    of the heap. The entries are persisted in a JSON file.
+
+    The triggers that are due at the same time are spread according to
+    their RF airtime: an entry is not fired before the previous one had
+    the time to be transmitted.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fire: Callable[[dict], None],
+        airtime: Callable[[dict], float],
+        logger: logging.Logger | None = None,
+    ) -> None:
+        """Initialize the scheduler.
+
+        Args:
+            path (str): The path to the schedule file.
+            fire (Callable): Send the command of an entry.
+            airtime (Callable): Return the airtime of the command of an
+            entry in seconds.
+            logger (logging.Logger, optional): The logger.
+        """
+        self.path = path
+        self.fire = fire
+        self.airtime = airtime
+        self.logger = logger or logging.getLogger(__name__)
+        self._entries = {}
+        # Sequence number of the current heap item of each entry
+        self._sequences = {}
+        self._heap = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._save_lock = threading.Lock()
+        self._airtime_free_at = 0
+        self._running = False
+        self._thread = None
+
+    def load(self) -> None:
+        """Load the entries from the schedule file."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                entries = json.load(file)
+
+        except FileNotFoundError:
+            entries = []
+
+        now = time.time()
+        with self._condition:
+            for entry in entries:
+                entry = validate_entry(entry)
+
+                if "at" in entry and now - MISFIRE_GRACE <= entry["at"] <= now:
+                    # Missed while the service was down
+                    entry["at"] = now
+
+                self._push(entry, now - 1e-6)
+
+            self._condition.notify()
+
+        self.logger.info("Loaded %s scheduled entries.", len(self._entries))
+
+    def save(self) -> None:
+        """Write the entries to the schedule file."""
+        with self._save_lock:
+            with self._condition:
+                entries = list(self._entries.values())
+
+            # Replace the file at once, it is never left half written
+            temporary_path = f"{self.path}.tmp"
+            with open(temporary_path, "w", encoding="utf-8") as file:
+                json.dump(entries, file, indent=4)
+
+            os.replace(temporary_path, self.path)
+
+    def entries(self) -> list:
+        """Return the entries, with their next fire time."""
+        with self._condition:
+            next_times = {
+                entry_id: fire_time
+                for fire_time, sequence, entry_id in self._heap
+                if self._sequences.get(entry_id) == sequence
+            }
+            return [
+                dict(entry, next=next_times[entry_id])
+                for entry_id, entry in self._entries.items()
+            ]
+
+    def add(self, entry: dict) -> dict:
+        """Add (or replace) an entry and persist it.
+
+        Raises:
+            ValueError: If the entry is not valid, will never fire, or
+            names an unknown recipe or group.
+        """
+        entry = validate_entry(entry)
+
+        # Also rejects the unknown recipes and groups
+        self.airtime(entry)
+
+        with self._condition:
+            if next_fire_time(entry, time.time()) is None:
+                raise ValueError("The entry will never fire.")
+
+            self._push(entry, time.time())
+            self._condition.notify()
+
+        self.save()
+        return entry
+
+    def remove(self, entry_id: str) -> bool:
+        """Remove an entry and persist the change.
+
+        Returns:
+            bool: True if the entry existed.
+        """
+        with self._condition:
+            existed = self._entries.pop(entry_id, None) is not None
+            self._sequences.pop(entry_id, None)
+
+        if existed:
+            self.save()
+
+        return existed
+
+    def _push(self, entry: dict, after: float) -> None:
+        """Push the next fire time of an entry on the heap."""
+        fire_time = next_fire_time(entry, after)
+
+        if fire_time is None:
+            self._entries.pop(entry["id"], None)
+            self._sequences.pop(entry["id"], None)
+            return
+
+        sequence = next(self._sequence)
+        self._entries[entry["id"]] = entry
+        self._sequences[entry["id"]] = sequence
+        heapq.heappush(self._heap, (fire_time, sequence, entry["id"]))
+
+    def start(self) -> None:
+        """Start the scheduler thread."""
+        if self._thread is not None:
+            return
+
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run, name="Scheduler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the scheduler thread."""
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _pop_due(self) -> dict | None:
+        """Wait for the next due entry, return None when stopped."""
+        with self._condition:
+            while self._running:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+
+                fire_time, sequence, entry_id = self._heap[0]
+
+                # Drop the removed or replaced entries
+                if self._sequences.get(entry_id) != sequence:
+                    heapq.heappop(self._heap)
+                    continue
+
+                entry = self._entries[entry_id]
+
+                # Do not fire before the previous command has been sent
+                wait = max(fire_time, self._airtime_free_at) - time.time()
+
+                if wait > 0:
+                    self._condition.wait(wait)
+                    continue
+
+                heapq.heappop(self._heap)
+
+                if "at" in entry:
+                    del self._entries[entry_id]
+                    del self._sequences[entry_id]
+
+                else:
+                    self._push(entry, fire_time)
+
+                return entry
+
+        return None
+
+    def _run(self) -> None:
+        while True:
+            entry = self._pop_due()
+
+            if entry is None:
+                break
+
+            if "at" in entry:
+                try:
+                    self.save()
+
+                except OSError:
+                    self.logger.exception("Could not save the schedule.")
+
+            # A bad entry (e.g. its recipe was removed from the settings)
+            # is skipped, it must not stop the scheduler thread
+            try:
+                airtime = self.airtime(entry)
+
+                with self._condition:
+                    self._airtime_free_at = time.time() + airtime
+
+                self.logger.info("Fire scheduled entry %s.", entry)
+
+                # Fire in a thread so the commands are pipelined on the link
+                threading.Thread(
+                    target=self._fire, args=(entry,), daemon=True
+                ).start()
+
+            except Exception:  # pylint: disable=broad-except
+                self.logger.exception("Skip scheduled entry %s.", entry["id"])
+
+    def _fire(self, entry: dict) -> None:
+        try:
+            self.fire(entry)
+
+        except Exception:  # pylint: disable=broad-except
+            self.logger.exception("Could not fire %s.", entry["id"])
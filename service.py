@@ -0,0 +1,946 @@
+"""Handle the requests to the covers and the pins, whatever the server.
+
+The handlers take a `Request` and the app config, and return a
+`Response`, so they can be hosted by the Flask server (flask_route.py) or
+by the asyncio server (embedded_server.py).
+"""
+
+from __future__ import annotations
+
+import contextvars
+import json
+import math
+import os
+import re
+import threading
+import time
+from contextlib import ExitStack
+from typing import NamedTuple
+
+import somfy_frame_generator as frame_generator
+from admission import AdmissionController, Rejected, admission_settings
+from coalescing import (
+    Coalescer,
+    CommandSuperseded,
+    coalesce_window,
+    is_stop,
+)
+from interpreter import decode_str_commands
+from link import DEFAULT_WINDOW, CommandLink
+from positioning import PositionController
+from profiler import Sampler, collapse, is_authorized, profiler_token
+from pulses import (
+    TRAIN,
+    PulseTracker,
+    compile_train,
+    parse_train,
+    train_ends,
+    validate_pulse,
+)
+from router import NodeUnreachable, Router
+from scheduler import Scheduler, command_airtime, schedule_path
+from shutter_index import ShutterIndex
+from supervisor import DEFAULT_INTERVAL, RECONNECT_TIMEOUT, LinkSupervisor
+from tracing import span, tracer, tracing_path
+from uart import UART
+
+pulse_tracker = PulseTracker()
+coalescer = Coalescer()
+sampler = Sampler()
+
+_shutter_locks = {}
+_shutter_locks_guard = threading.Lock()
+
+# Maximum time to wait for the previous pulse on the same pin (in seconds)
+PULSE_WAIT_TIMEOUT = 60
+
+
+def _send_to_remote(
+    current_link: CommandLink,
+    current_decoded_command: dict,
+    timeout: float | None = None,
+):
+    """Send a command to the remote.
+
+    Args:
+        current_link (CommandLink): The tagged command link of the remote.
+        current_decoded_command (dict): The decoded command.
+        timeout (float, optional): The timeout. Defaults to the deadline
+        learned from the previous echoes (see latency.py).
+
+    Returns:
+        tuple: The response (without its tag) and the response check.
+    """
+    frame = current_decoded_command["frame"]
+
+    # The frames carry their wire bytes (with the number of repetitions),
+    # encoded once
+    if isinstance(frame, frame_generator.Frame):
+        payload = frame.wire
+
+    else:
+        payload = frame.encode("utf-8")
+
+    # Wait for the reply from UART until the deadline of the command, the
+    # other commands in flight are not blocked meanwhile
+    uart_response = current_link.send(
+        payload,
+        timeout=timeout,
+        airtime=current_decoded_command.get("airtime", 0),
+    )
+
+    if uart_response is None:
+        return b"", False
+
+    # Validate that the right command has been sent
+    uart_response = uart_response.split(b" ", 1)[-1]
+    check_response = payload in uart_response
+
+    return uart_response, check_response
+
+
+def _shutter_lock(shutter: str) -> threading.Lock:
+    """Return the lock serializing the commands sent to a shutter.
+
+    The rolling code counter of a shutter is read when the command is
+    decoded and incremented once the frame is sent, so the commands of a
+    shutter must not overlap.
+    """
+    with _shutter_locks_guard:
+        return _shutter_locks.setdefault(shutter, threading.Lock())
+
+
+def _extract_command(parameters: dict) -> str:
+    """Extract the command from the parameters.
+
+    Args:
+        parameters (dict): The parameters.
+
+    Returns:
+        str: The command.
+    """
+    if ("name" in parameters) and ("action" in parameters):
+        return (
+            f'send(\'{parameters["name"]}\',' f' \'{parameters["action"]}\')'
+        )
+
+    if ("pin" in parameters) and ("delay" in parameters):
+        return f'pulse({parameters["pin"]}, {parameters["delay"]})'
+
+    if "train" in parameters:
+        return f'train({parameters["train"]})'
+
+    return None
+
+
+def _decode_command(command: str, config_file_path) -> dict:
+    """Decode the command.
+
+    Args:
+        command (str): The command.
+
+    Returns:
+        dict: The decoded command.
+    """
+    if command.startswith("send"):
+        return decode_str_commands(config_file_path, command)[0]
+
+    return {"frame": command}
+
+
+def transmit(parameters: dict, config: dict) -> str:
+    """Send the command described by the parameters to the remote.
+
+    This is the transmit path shared by the HTTP requests and the
+    scheduler.
+
+    Args:
+        parameters (dict): The parameters ("name" and "action", "pin"
+        and "delay", or "train").
+        config (dict): The app config (logger, link, supervisor, ...).
+
+    Returns:
+        str: The response.
+
+    Raises:
+        CommandSuperseded: If a newer command for the same shutter has
+        been received before this one was sent.
+    """
+    # The duration of the pulse on each pin (in ms)
+    pulses = {}
+    # The serial command of a pulse train, compiled once
+    compiled = None
+
+    if ("name" in parameters) and ("action" in parameters):
+        # Before the coalescing, an invalid command must not supersede
+        # the valid ones
+        try:
+            _check_action(parameters["action"])
+            frame_generator.frame_repeats(
+                config["SETTINGS_FILE"],
+                parameters["name"],
+                parameters["action"],
+            )
+
+        except ValueError as error:
+            return f"S: {error}"
+
+    elif ("pin" in parameters) and ("delay" in parameters):
+        try:
+            pulse_pin = int(parameters["pin"])
+            pulse_delay = int(parameters["delay"])
+            validate_pulse(pulse_pin, pulse_delay)
+
+        except ValueError as error:
+            return f"S: {error}"
+
+        pulses = {pulse_pin: pulse_delay}
+
+    elif "train" in parameters:
+        try:
+            train = parse_train(parameters["train"])
+            compiled = compile_train(train)
+
+        except ValueError as error:
+            return f"S: {error}"
+
+        pulses = train_ends(train)
+
+    claimed = []
+
+    try:
+        # Wait for the previous pulses on the same pins (in the same
+        # order for every command), the other pins and the covers are not
+        # blocked meanwhile
+        for pin in sorted(pulses, key=str):
+            with span("pulse.wait", pin=pin):
+                if not pulse_tracker.acquire(pin, PULSE_WAIT_TIMEOUT):
+                    if pin == TRAIN:
+                        return "S: A pulse train is still running."
+
+                    return f"S: Pin {pin} is still busy."
+
+            claimed.append(pin)
+
+        return _handle_request(parameters, pulses, config, compiled)
+
+    finally:
+        for pin in claimed:
+            pulse_tracker.release(pin)
+
+
+def _wait_for_shutter(
+    parameters: dict, config: dict, stack: ExitStack
+) -> None:
+    """Wait for the turn of a shutter command, drop it if superseded.
+
+    The command waits for the coalescing window of the shutter, then for
+    the previous command of the shutter to be sent. It is dropped if a
+    newer command for the same shutter has been received meanwhile.
+
+    Raises:
+        CommandSuperseded: If a newer command has been received.
+    """
+    shutter, action = parameters["name"], parameters["action"]
+    ticket = coalescer.register(shutter, action)
+    window = coalesce_window(config["SETTINGS_FILE"], shutter)
+
+    if window > 0 and not is_stop(action):
+        with span("coalesce.window", shutter=shutter, window=window):
+            time.sleep(window)
+
+        coalescer.check(shutter, action, ticket)
+
+    # Several commands can be in flight, but only one per shutter
+    with span("shutter.wait", shutter=shutter):
+        stack.enter_context(_shutter_lock(shutter))
+
+    coalescer.check(shutter, action, ticket)
+
+
+def _handle_request(
+    parameters: dict,
+    pulses: dict,
+    config: dict,
+    compiled: str | None = None,
+) -> str:
+    """Send the command described by the parameters to the remote.
+
+    Args:
+        parameters (dict): The parameters of the request.
+        pulses (dict): The duration (in ms) of the pulses of the command,
+        by pin claimed.
+        config (dict): The app config.
+        compiled (str, optional): The serial command, if already compiled
+        (pulse trains). Defaults to None.
+
+    Returns:
+        str: The response.
+    """
+    logger = config["LOGGER"]
+    link = config["LINK"]
+    supervisor = config["SUPERVISOR"]
+
+    command = _extract_command(parameters)
+
+    if command is None:
+        return "S: Invalid command."
+
+    # The link is checked and reconnected by the supervisor
+    if not supervisor.connected:
+        logger.error("The remote is not connected (%s).", command)
+        return "S: The remote is not connected."
+
+    with ExitStack() as stack:
+        if command.startswith("send"):
+            _wait_for_shutter(parameters, config, stack)
+
+        logger.debug(command)
+        if compiled is not None:
+            decoded_command = {"frame": compiled}
+
+        else:
+            decoded_command = _decode_command(
+                command, config["SETTINGS_FILE"]
+            )
+
+        logger.debug("In HTTP server decoded_command = %s", decoded_command)
+
+        # Check and retry if needed
+        transmit_start = time.monotonic()
+
+        for try_index in range(10):
+            with span(
+                "transmit.attempt",
+                attempt=try_index,
+                airtime=decoded_command.get("airtime"),
+            ) as attributes:
+                uart_response, check_command = _send_to_remote(
+                    link, decoded_command
+                )
+                attributes["echoed"] = check_command
+
+            if check_command:
+                break
+
+            # A pulse (or a train) whose echo was not received may have
+            # been executed, sending it again could drive the pins twice
+            if pulses and not uart_response:
+                logger.error("No echo for %s, not sent again.", command)
+                supervisor.report_failure()
+                break
+
+            logger.error(
+                "Command failed (%s), checking remote and retrying... (%s)",
+                command,
+                try_index,
+            )
+
+            # Let the supervisor check (and reconnect) the remote, it
+            # only reports a connection once the firmware answers
+            supervisor.report_failure()
+
+            with span("transmit.reconnect_wait", attempt=try_index):
+                time.sleep(try_index * 2)
+
+                if not supervisor.wait_connected((try_index + 1) * 2):
+                    logger.error("The remote is still not connected.")
+
+        if check_command:
+            # Only the time on the link predicts the wait of the next
+            # commands
+            config["ADMISSION"].record_service(transmit_start)
+
+        # The firmware acknowledged the pulses (or may have executed them,
+        # without echo), they end on their own
+        if check_command or not uart_response:
+            for pin, delay in pulses.items():
+                pulse_tracker.start(pin, delay)
+
+        # Increment remote counter
+        if command.startswith("send"):
+            if check_command and len(decoded_command["arguments"]) == 2:
+                with span("counter.increment"):
+                    frame_generator.increment_shutter_counter(
+                        config["SETTINGS_FILE"],
+                        decoded_command["shutter"],
+                    )
+
+            if check_command:
+                config["SHUTTERS"].record(
+                    decoded_command["shutter"], decoded_command["command"]
+                )
+                config["POSITIONS"].record(
+                    decoded_command["shutter"],
+                    decoded_command["command"],
+                    decoded_command["airtime"],
+                )
+
+    logger.debug(
+        "UART TX %s\nUART RX %s\nTX == RX: %s",
+        decoded_command["frame"],
+        uart_response,
+        check_command,
+    )
+
+    if uart_response:
+        return f"\nTX: {uart_response.decode()}"
+
+    return "S: No response from remote."
+
+
+def _send_positioning(parameters: dict, config: dict) -> bool:
+    """Send a command of the position controller, return True if echoed."""
+    try:
+        return transmit(parameters, config).startswith("\nTX:")
+
+    except CommandSuperseded:
+        return False
+
+
+class UnknownTarget(LookupError):
+    """The recipe, the group or the shutter of a command is unknown."""
+
+
+def _check_action(action: str) -> None:
+    """Check that an action is a command of the shutters.
+
+    Raises:
+        ValueError: If the action is not valid.
+    """
+    if str(action).upper() not in frame_generator.COMMANDS:
+        raise ValueError(f"Invalid action ({action}).")
+
+
+def _steps(command: dict, config: dict) -> list:
+    """Return the commands of a command, a recipe or a group.
+
+    Raises:
+        UnknownTarget: If the recipe, the group or a shutter is unknown.
+        ValueError: If an action is not valid.
+    """
+    _config = frame_generator.read_settings(config["SETTINGS_FILE"])
+
+    if "recipe" in command:
+        recipe = _config.get("Recipes", {}).get(command["recipe"])
+
+        if recipe is None:
+            raise UnknownTarget(f"Unknown recipe ({command['recipe']}).")
+
+        steps = [
+            {"name": step["shutter"], "action": step["command"]}
+            for step in recipe
+        ]
+
+    elif "group" in command:
+        group = _config.get("Groups", {}).get(command["group"])
+
+        if group is None:
+            raise UnknownTarget(f"Unknown group ({command['group']}).")
+
+        steps = [{"name": name, "action": command["action"]} for name in group]
+
+    else:
+        steps = [command]
+
+    for step in steps:
+        if "name" in step and step["name"] not in _config["shutters"]:
+            raise UnknownTarget(f"Unknown shutter ({step['name']}).")
+
+        if "action" in step:
+            _check_action(step["action"])
+
+        # E.g. the "repeats" of the shutter are not valid
+        if "name" in step and "action" in step:
+            frame_generator.frame_repeats(
+                config["SETTINGS_FILE"], step["name"], step["action"]
+            )
+
+    return steps
+
+
+def _forward(
+    node: str, parameters: dict, config: dict, path: str = "/"
+) -> Response:
+    """Forward a command to the node serving its shutter."""
+    try:
+        status, body = config["ROUTER"].forward(node, parameters, path)
+
+    except NodeUnreachable as error:
+        config["LOGGER"].error("Could not forward %s: %s", parameters, error)
+        return Response(502, f"S: The node {node} is unreachable: {error}")
+
+    body = body.decode("utf-8", "replace")
+
+    if status == 200 and body.startswith("\nTX:"):
+        config["SHUTTERS"].record(parameters["name"], parameters["action"])
+
+    return Response(status, body)
+
+
+def _run_step(step: dict, config: dict) -> str:
+    """Send a command to the remote, or to the node serving its shutter."""
+    node = config["ROUTER"].node_of(step)
+
+    if node is not None:
+        return _forward(node, step, config).body
+
+    try:
+        return transmit(step, config)
+
+    except CommandSuperseded as error:
+        return f"S: {error}"
+
+
+def run_command(command: dict, config: dict) -> list:
+    """Send a command, or the commands of a recipe or a group.
+
+    The commands are sent in order to each node (the local remote being
+    one of them), and the nodes are commanded in parallel.
+
+    Args:
+        command (dict): The parameters of the command, {"recipe": ...} or
+        {"group": ..., "action": ...}.
+        config (dict): The app config.
+
+    Returns:
+        list: The responses, in the order of the commands.
+    """
+    steps = _steps(command, config)
+    responses = [None] * len(steps)
+
+    batches = {}
+    for index, step in enumerate(steps):
+        batches.setdefault(config["ROUTER"].node_of(step), []).append(index)
+
+    def run(indexes: list) -> None:
+        for index in indexes:
+            responses[index] = _run_step(steps[index], config)
+
+    # The threads inherit the trace of the command
+    threads = [
+        threading.Thread(
+            target=contextvars.copy_context().run, args=(run, indexes)
+        )
+        for indexes in list(batches.values())[1:]
+    ]
+    for thread in threads:
+        thread.start()
+
+    if batches:
+        run(next(iter(batches.values())))
+
+    for thread in threads:
+        thread.join()
+
+    return responses
+
+
+class Request(NamedTuple):
+    """A request, independent of the server."""
+
+    method: str
+    path: str
+    query: dict
+    body: bytes = b""
+    headers: dict | None = None
+    client: str | None = None
+
+
+class Response(NamedTuple):
+    """A response, independent of the server."""
+
+    status: int
+    body: str | bytes
+    content_type: str = "text/plain; charset=utf-8"
+    headers: dict | None = None
+
+
+def json_response(data, status: int = 200) -> Response:
+    """Return a JSON response."""
+    return Response(status, json.dumps(data), "application/json")
+
+
+# To interact with the blinds:
+# http://hostname:port/?name=<a_name>&action=<valid_action>
+
+# To run a recipe, or to command a group of blinds:
+# http://hostname:port/?recipe=<a_recipe>
+# http://hostname:port/?group=<a_group>&action=<valid_action>
+
+# To interact with the pins:
+# http://hostname:port/?pin=<pin_number>&delay=<delay_in_ms>
+# http://hostname:port/?train=<pin>:<start_in_ms>:<duration_in_ms>,...
+
+
+def handle_command(request: Request, config: dict) -> Response:
+    """Handle the commands sent to the covers and the pins."""
+    if request.method not in ("GET", "POST"):
+        return Response(
+            200,
+            "S: Invalid request method ("
+            f"{request.method}), use GET or POST.",
+        )
+
+    is_batch = "recipe" in request.query or (
+        "group" in request.query and "action" in request.query
+    )
+
+    if not is_batch and _extract_command(request.query) is None:
+        config["LOGGER"].debug("In HTTP server %s", request.query)
+        return Response(200, str(request.query))
+
+    try:
+        _steps(request.query, config)
+
+    except UnknownTarget as error:
+        return Response(404, f"S: {error}")
+
+    except ValueError as error:
+        return Response(400, f"S: {error}")
+
+    # The shutters served by another node are commanded by that node
+    node = config["ROUTER"].node_of(request.query)
+    if node is not None:
+        return _forward(node, request.query, config)
+
+    try:
+        # Reject at once the commands that would wait too long
+        with config["ADMISSION"].admit(request.client):
+            if is_batch:
+                return json_response(run_command(request.query, config))
+
+            return Response(200, transmit(request.query, config))
+
+    except Rejected as error:
+        config["LOGGER"].info("Command rejected: %s", error)
+        retry_after = max(1, math.ceil(min(error.retry_after, 3600)))
+        return Response(
+            429, f"S: {error}", headers={"Retry-After": str(retry_after)}
+        )
+
+    except CommandSuperseded as error:
+        config["LOGGER"].info("%s", error)
+        return Response(409, f"S: {error}")
+
+
+def handle_list_schedule(_: Request, config: dict) -> Response:
+    """List the scheduled commands and recipes."""
+    return json_response(config["SCHEDULER"].entries())
+
+
+def handle_add_schedule(request: Request, config: dict) -> Response:
+    """Schedule a command or a recipe (JSON body, see scheduler.py)."""
+    try:
+        entry = config["SCHEDULER"].add(json.loads(request.body))
+
+    except (ValueError, AttributeError) as error:
+        return json_response({"error": str(error)}, 400)
+
+    return json_response(entry, 201)
+
+
+def handle_remove_schedule(
+    _: Request, config: dict, entry_id: str
+) -> Response:
+    """Remove a scheduled command or recipe."""
+    if config["SCHEDULER"].remove(entry_id):
+        return Response(204, "")
+
+    return json_response({"error": f"Unknown entry ({entry_id})."}, 404)
+
+
+def handle_shutters(request: Request, config: dict) -> Response:
+    """List the shutters and their last commanded state.
+
+    The listing has an ETag, a request with a matching "If-None-Match"
+    header gets an empty 304 response.
+    """
+    index = config["SHUTTERS"]
+    if_none_match = (request.headers or {}).get("If-None-Match")
+
+    if if_none_match is not None and if_none_match == index.etag:
+        return Response(304, "", headers={"ETag": if_none_match})
+
+    etag, shutters = index.listing()
+    response = json_response({"shutters": shutters})
+
+    return response._replace(headers={"ETag": etag})
+
+
+def handle_position(request: Request, config: dict) -> Response:
+    """Move a shutter to a position (from 0, closed, to 100, open).
+
+    The move is planned and started in the background, the plan is
+    returned at once (202).
+    """
+    # The shutters served by another node are positioned by that node
+    node = config["ROUTER"].node_of(request.query)
+    if node is not None:
+        return _forward(node, request.query, config, "/position")
+
+    try:
+        plan = config["POSITIONS"].set_position(
+            request.query["name"], int(request.query["position"])
+        )
+
+    except KeyError as error:
+        return Response(400, f"S: Missing parameter ({error}).")
+
+    except ValueError as error:
+        return Response(400, f"S: {error}")
+
+    return json_response(plan, 202)
+
+
+def handle_positions(_: Request, config: dict) -> Response:
+    """Return the estimated positions and the STOP timing metrics."""
+    return json_response(
+        {
+            "shutters": config["POSITIONS"].positions(),
+            "metrics": config["POSITIONS"].metrics(),
+        }
+    )
+
+
+def handle_calibrate(request: Request, config: dict) -> Response:
+    """Measure the latency of the serial link with "samples" pings."""
+    try:
+        samples = min(1000, max(1, int(request.query.get("samples", 20))))
+
+    except ValueError as error:
+        return Response(400, f"S: {error}")
+
+    return json_response(config["POSITIONS"].calibrate(samples))
+
+
+def handle_profile(request: Request, config: dict) -> Response:
+    """Sample the stacks of all the threads, return the collapsed stacks.
+
+    The profile lasts "seconds" (10 by default) with a sample every
+    "interval" milliseconds (10 by default). The endpoint is disabled
+    unless "Debug.profiler_token" is set in the settings, and the token
+    must be sent in an "Authorization: Bearer <token>" header.
+    """
+    token = profiler_token(config["SETTINGS_FILE"])
+
+    if token is None:
+        return Response(404, "Not Found")
+
+    if not is_authorized(token, (request.headers or {}).get("Authorization")):
+        return Response(
+            401, "Unauthorized", headers={"WWW-Authenticate": "Bearer"}
+        )
+
+    try:
+        duration = float(request.query.get("seconds", 10))
+        interval = float(request.query.get("interval", 10)) / 1000
+
+    except ValueError as error:
+        return Response(400, f"S: {error}")
+
+    config["LOGGER"].info("Profiling the threads for %s s.", duration)
+    counts = sampler.sample(duration, interval)
+
+    if counts is None:
+        return Response(409, "S: A profile is already being taken.")
+
+    return Response(200, collapse(counts))
+
+
+def handle_health(_: Request, config: dict) -> Response:
+    """Return the cached health of the link, without using the port."""
+    snapshot = config["SUPERVISOR"].health()
+    return json_response(snapshot, 200 if snapshot["connected"] else 503)
+
+
+# The routes served by every server: (methods, path pattern, handler), the
+# named groups of the pattern are passed to the handler
+ROUTES = [
+    (("GET", "POST"), r"/", handle_command),
+    (("GET",), r"/schedule", handle_list_schedule),
+    (("POST",), r"/schedule", handle_add_schedule),
+    (("DELETE",), r"/schedule/(?P<entry_id>[^/]+)", handle_remove_schedule),
+    (("GET",), r"/shutters", handle_shutters),
+    (("GET",), r"/health", handle_health),
+    (("GET", "POST"), r"/position", handle_position),
+    (("GET",), r"/positions", handle_positions),
+    (("POST",), r"/positions/calibrate", handle_calibrate),
+    (("GET",), r"/debug/profile", handle_profile),
+]
+
+_COMPILED_ROUTES = [
+    (methods, re.compile(pattern), handler)
+    for methods, pattern, handler in ROUTES
+]
+
+
+def dispatch(request: Request, config: dict) -> Response:
+    """Call the handler of the route matching the request, within a trace.
+
+    The trace ID is taken from the "X-Trace-Id" header (or generated) and
+    returned in the same header. The client can send the time of the
+    request (epoch, in seconds) in "X-Trace-Sent" to trace the HTTP
+    queuing.
+    """
+    headers = request.headers or {}
+
+    with tracer.trace(headers.get("X-Trace-Id")) as trace_id:
+        if tracer.enabled and "X-Trace-Sent" in headers:
+            try:
+                sent = float(headers["X-Trace-Sent"])
+                tracer.record("http.queue", sent, time.time() - sent)
+
+            except ValueError:
+                pass
+
+        with span(
+            "http.request", method=request.method, path=request.path
+        ) as attributes:
+            response = _route(request, config)
+            attributes["status"] = response.status
+
+    return response._replace(
+        headers=dict(response.headers or {}, **{"X-Trace-Id": trace_id})
+    )
+
+
+def _route(request: Request, config: dict) -> Response:
+    """Call the handler of the route matching the request."""
+    path_matched = False
+
+    for methods, pattern, handler in _COMPILED_ROUTES:
+        match = pattern.fullmatch(request.path)
+
+        if match is None:
+            continue
+
+        path_matched = True
+        if request.method in methods:
+            return handler(request, config, **match.groupdict())
+
+    if path_matched:
+        return Response(405, "Method Not Allowed")
+
+    return Response(404, "Not Found")
+
+
+def create_config(settings_file: str, logger, transport=None) -> dict:
+    """Initialize the remote and the services, return the app config.
+
+    Args:
+        settings_file (str): The path to the settings file.
+        logger (logging.Logger): The logger.
+        transport (optional): A port replacing the serial port of the
+        remote (e.g. `uart_capture.ReplaySerial`). Defaults to None.
+
+    Returns:
+        dict: The app config used by the handlers.
+    """
+    settings = frame_generator.read_config_file(settings_file)
+
+    # Record the spans of the requests, if enabled
+    tracer.configure(tracing_path(settings_file))
+    logger.debug("tracing = %s", tracer.path)
+
+    # The commands of these shutters are rejected (400)
+    for shutter, error in frame_generator.invalid_repeats(
+        settings_file
+    ).items():
+        logger.error("Invalid repeats for %s: %s", shutter, error)
+
+    # Initialize the remote
+    logger.info("Initialize remote (UART link).")
+
+    vid_sr = settings["UART"]["VID_SR"]
+    bauderate = settings["UART"]["SPEED"]
+    timeout = 0.1
+    mocking = settings["Test"]["remote_mocking"]
+    capture_path = settings["Test"].get("uart_capture")
+
+    if capture_path is not None and not os.path.isabs(capture_path):
+        capture_path = os.path.join(
+            os.path.dirname(settings_file), capture_path.replace("./", "")
+        )
+
+    logger.debug("vid_sr = %s", vid_sr)
+    logger.debug("bauderate = %s", bauderate)
+    logger.debug("timeout = %s", timeout)
+    logger.debug("mocking = %s", mocking)
+    logger.debug("capture_path = %s", capture_path)
+
+    # Opening the port resets the Arduino, unless avoided
+    reset_on_connect = settings["UART"].get("RESET_ON_CONNECT", False)
+    logger.debug("reset_on_connect = %s", reset_on_connect)
+
+    remote = UART(
+        vid_sr,
+        bauderate,
+        timeout,
+        mocking,
+        transport=transport,
+        capture_path=capture_path,
+        reset_on_connect=reset_on_connect,
+    )
+
+    if mocking:
+        logger.debug("The remote is being mocked.")
+
+    else:
+        if not remote.connect(RECONNECT_TIMEOUT):
+            logger.error("Could not connect to the remote.")
+            logger.error("Will try again in the background.")
+
+    # Keep several tagged commands in flight on the serial link
+    window = settings["UART"].get("WINDOW", DEFAULT_WINDOW)
+    logger.debug("window = %s", window)
+
+    link = CommandLink(remote, window, logger)
+    link.start()
+
+    # Check and reconnect the link in the background
+    check_interval = settings["UART"].get("CHECK_INTERVAL", DEFAULT_INTERVAL)
+    logger.debug("check_interval = %s", check_interval)
+
+    supervisor = LinkSupervisor(remote, link, check_interval, logger)
+    supervisor.start()
+
+    # Estimate the positions of the shutters from their travel times
+    positions = PositionController(
+        settings_file,
+        send=lambda parameters: _send_positioning(parameters, config),
+        ping=lambda: b"PING" in (link.send("PING", timeout=1) or b""),
+        logger=logger,
+        node_of=lambda shutter: config["ROUTER"].node_of({"name": shutter}),
+    )
+
+    config = {
+        "LOGGER": logger,
+        "REMOTE": remote,
+        "LINK": link,
+        "SUPERVISOR": supervisor,
+        "SETTINGS_FILE": settings_file,
+        "SHUTTERS": ShutterIndex(settings_file, positions),
+        "POSITIONS": positions,
+        "ADMISSION": AdmissionController(**admission_settings(settings_file)),
+        "ROUTER": Router(settings_file),
+    }
+
+    # Fire the scheduled commands through the same transmit path
+    scheduler = Scheduler(
+        schedule_path(settings_file),
+        fire=lambda entry: logger.info(
+            "Scheduled %s: %s",
+            entry["id"],
+            run_command(entry["command"], config),
+        ),
+        airtime=lambda entry: command_airtime(
+            entry["command"], settings_file
+        ),
+        logger=logger,
+    )
+    scheduler.load()
+    scheduler.start()
+    config["SCHEDULER"] = scheduler
+
+    return config
@@ -0,0 +1,109 @@
+"""Index the shutters and their last commanded state in memory."""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+
+import somfy_frame_generator as frame_generator
+
+# State assumed after each command (the covers do not report their state)
+STATES = {
+    frame_generator.COMMANDS["UP"]: "open",
+    frame_generator.COMMANDS["DOWN"]: "closed",
+    frame_generator.COMMANDS["STOP"]: "stopped",
+}
+
+
+class ShutterIndex:
+    """The shutters of the settings and their last commanded state.
+
+    The listing is served from memory. Its version changes each time a
+    shutter is commanded or the settings file is modified, and is used as
+    the ETag of the listing, so the clients can poll all the shutters with
+    a single conditional request.
+
+    With a `positioning.PositionController`, the listing also has the
+    estimated position of the shutters, and the version of the estimates
+    is part of the ETag.
+    """
+
+    def __init__(self, config_file_path: str, positions=None) -> None:
+        self.config_file_path = config_file_path
+        self.positions = positions
+        self._lock = threading.Lock()
+        self._states = {}
+        self._shutters = {}
+        self._settings_mtime = None
+        self._version = 0
+        # The versions restart with the service, so the ETags include the
+        # start time of the index
+        self._instance = f"{time.time_ns():x}"
+
+    @property
+    def etag(self) -> str:
+        """Return the ETag of the current listing."""
+        if self.positions is not None:
+            self.positions.refresh()
+
+        with self._lock:
+            self._reload_if_modified()
+            return self._etag()
+
+    def _etag(self) -> str:
+        if self.positions is None:
+            return f'"{self._instance}-{self._version}"'
+
+        return f'"{self._instance}-{self._version}-{self.positions.version}"'
+
+    def _reload_if_modified(self) -> None:
+        """Reload the shutters if the settings file has been modified."""
+        mtime = os.stat(self.config_file_path).st_mtime_ns
+
+        if mtime == self._settings_mtime:
+            return
+
+        _config = frame_generator.read_config_file(self.config_file_path)
+        self._shutters = _config["shutters"]
+        self._settings_mtime = mtime
+        self._version += 1
+
+    def record(self, shutter: str, action: str) -> None:
+        """Record a command sent to a shutter."""
+        code = frame_generator.COMMANDS.get(str(action).upper())
+
+        with self._lock:
+            self._states[shutter] = {
+                "action": str(action).upper(),
+                "state": STATES.get(code),
+                "updated": time.time(),
+            }
+            self._version += 1
+
+    def listing(self) -> tuple[str, list]:
+        """Return the ETag and the list of the shutters with their state."""
+        positions = {}
+        if self.positions is not None:
+            positions = self.positions.positions()
+
+        with self._lock:
+            self._reload_if_modified()
+            etag = self._etag()
+            shutters = [
+                {
+                    "name": name,
+                    "id": conf.get("id"),
+                    "node": conf.get("node"),
+                    "travel_time": conf.get("travel_time"),
+                    **self._states.get(
+                        name, {"action": None, "state": None, "updated": None}
+                    ),
+                    **positions.get(
+                        name, {"position": None, "moving": None}
+                    ),
+                }
+                for name, conf in self._shutters.items()
+            ]
+
+        return etag, shutters
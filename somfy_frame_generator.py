@@ -2,6 +2,7 @@
 
 import json
 import os
+import threading
 
 # 0x1 | My | Stop or move to favourite position
 # 0x2 | Up | Move up
@@ -45,6 +46,119 @@ COMMANDS = {
     "SUN_UNFLAG": 0x0A,
 }
 
+# Timings of the frames sent by the firmware (in microseconds, see main.cpp)
+SYMBOL = 640
+WAKE_UP = 9415 + 24030 + 65535
+SOFTWARE_SYNC = 4550 + SYMBOL
+DATA = 56 * 2 * SYMBOL
+INTER_FRAME_GAP = 30415
+
+# Number of repetitions sent after the first frame of a command (by default,
+# and at most, see main.cpp)
+FRAME_REPEATS = 2
+MAX_REPEATS = 30
+
+
+def frame_airtime(repeats: int = FRAME_REPEATS) -> float:
+    """Return the airtime of a command in seconds.
+
+    The first frame starts with a wake-up pulse and 2 hardware syncs, the
+    repetitions start with 7 hardware syncs.
+
+    Args:
+        repeats (int, optional): The number of repetitions of the frame.
+        Defaults to FRAME_REPEATS.
+
+    Returns:
+        float: The airtime in seconds.
+    """
+
+    def _frame(hardware_syncs: int) -> int:
+        return (
+            hardware_syncs * 8 * SYMBOL
+            + SOFTWARE_SYNC
+            + DATA
+            + INTER_FRAME_GAP
+        )
+
+    return (WAKE_UP + _frame(2) + repeats * _frame(7)) / 1e6
+
+
+def frame_repeats(config_file_path: str, shutter_key: str, command) -> int:
+    """Return the number of repetitions of a command sent to a shutter.
+
+    The "repeats" of the shutter, then the top-level "repeats" of the
+    settings, are either a number or a policy per command, e.g.
+    {"STOP": 1, "PROG": 12, "default": 2}. FRAME_REPEATS is used if no
+    policy applies.
+
+    Raises:
+        ValueError: If the command or the number of repetitions is not
+        valid.
+    """
+    _config = read_settings(config_file_path)
+    _policies = (
+        _config["shutters"].get(shutter_key, {}).get("repeats"),
+        _config.get("repeats"),
+    )
+
+    if isinstance(command, str):
+        if command.upper() not in COMMANDS:
+            raise ValueError(f"Invalid action ({command}).")
+
+        command = COMMANDS[command.upper()]
+
+    names = [name for name, code in COMMANDS.items() if code == command]
+    repeats = FRAME_REPEATS
+
+    for policy in _policies:
+        if isinstance(policy, int):
+            repeats = policy
+            break
+
+        if isinstance(policy, dict):
+            policy = {str(key).upper(): value for key, value in policy.items()}
+            matches = [policy[name] for name in names if name in policy]
+
+            if matches or "DEFAULT" in policy:
+                repeats = matches[0] if matches else policy["DEFAULT"]
+                break
+
+    try:
+        valid = 0 <= int(repeats) <= MAX_REPEATS
+
+    except (TypeError, ValueError):
+        valid = False
+
+    if not valid:
+        raise ValueError(
+            f"The number of repetitions must be between 0 and {MAX_REPEATS}"
+            f" (received {repeats})."
+        )
+
+    return int(repeats)
+
+
+def invalid_repeats(config_file_path: str) -> dict:
+    """Check the "repeats" of the settings for every shutter and command.
+
+    Returns:
+        dict: The error of each shutter with an invalid policy.
+    """
+    _config = read_settings(config_file_path)
+    errors = {}
+
+    for shutter_key in _config["shutters"]:
+        for command in set(COMMANDS.values()):
+            try:
+                frame_repeats(config_file_path, shutter_key, command)
+
+            except ValueError as error:
+                errors[shutter_key] = str(error)
+                break
+
+    return errors
+
 
 def str_to_int(string: str) -> int:
     """Try to convert a string to an int
@@ -71,6 +185,37 @@ def read_config_file(path: str = "") -> any:
         return json.load(file)
 
 
+# The parsed settings files, with the modification time and the size of
+# each file when it was parsed
+_settings_cache = {}
+_settings_cache_lock = threading.Lock()
+
+
+def read_settings(path: str) -> dict:
+    """Return the content of a settings file, parsed once per modification.
+
+    The settings are read for every command sent, they are parsed again
+    only when the modification time or the size of the file changes (like
+    `shutter_index.ShutterIndex`). The returned dict is shared, it must
+    not be modified.
+    """
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+
+    with _settings_cache_lock:
+        cached = _settings_cache.get(path)
+
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+    settings = read_config_file(path)
+
+    with _settings_cache_lock:
+        _settings_cache[path] = (version, settings)
+
+    return settings
+
+
 def write_config_file(content: dict, path: str = "") -> None:
     """Write a json file with the given content"""
     with open(path, "w", encoding="utf-8") as file:
@@ -101,7 +246,7 @@ def read_counter(path: str = "") -> int:
 
 def frame_to_string(frame: bytearray) -> str:
     """Convert a frame to a string"""
-    return " ".join([("0" + hex(byte)[2:])[-2:].upper() for byte in frame])
+    return bytes(frame).hex(" ").upper()
 
 
 def print_frame(frame: bytearray) -> None:
@@ -162,6 +307,26 @@ def generate_somfy_obfuscate_frame(frame: bytearray) -> bytearray:
     return frame
 
 
+def decode_somfy_frame(frame: str | bytearray) -> tuple:
+    """Decode an obfuscated frame (or its string).
+
+    Returns:
+        tuple: The command code, the rolling code counter and the remote ID.
+    """
+    if isinstance(frame, str):
+        frame = bytes.fromhex(frame)
+
+    frame = bytearray(frame)
+    for index in range(6, 0, -1):
+        frame[index] ^= frame[index - 1]
+
+    return (
+        frame[1] >> 4,
+        frame[2] << 8 | frame[3],
+        frame[4] << 16 | frame[5] << 8 | frame[6],
+    )
+
+
 def generate_somfy_full_frame(
     command, rolling_code_counter, remote_id
 ) -> list:
@@ -173,9 +338,71 @@ def generate_somfy_full_frame(
     )
 
 
+class Frame:
+    """An obfuscated frame, with its decoded fields and its wire bytes.
+
+    The frame is generated and encoded once: `wire` is the payload sent
+    to the firmware ("A7 89 ...", followed by ":<repeats>" unless the
+    default number of repetitions is used), and is also the payload of
+    its echo.
+    """
+
+    __slots__ = ("command", "counter", "remote_id", "repeats", "data", "wire")
+
+    def __init__(
+        self,
+        command,
+        rolling_code_counter,
+        remote_id,
+        repeats: int = FRAME_REPEATS,
+    ) -> None:
+        frame = generate_somfy_base_frame(
+            command, rolling_code_counter, remote_id
+        )
+        set_field = super().__setattr__
+
+        # The decoded fields (normalized by generate_somfy_base_frame())
+        set_field("command", frame[1] >> 4)
+        set_field("counter", frame[2] << 8 | frame[3])
+        set_field("remote_id", frame[4] << 16 | frame[5] << 8 | frame[6])
+
+        data = bytes(
+            generate_somfy_obfuscate_frame(
+                generate_somfy_add_frame_checksum(frame)
+            )
+        )
+        wire = data.hex(" ").upper()
+
+        # The firmware sends FRAME_REPEATS repetitions unless told otherwise
+        if repeats != FRAME_REPEATS:
+            wire = f"{wire}:{repeats}"
+
+        set_field("repeats", repeats)
+        set_field("data", data)
+        set_field("wire", wire.encode("ascii"))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable.")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable.")
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Frame) and self.wire == other.wire
+
+    def __hash__(self) -> int:
+        return hash(self.wire)
+
+    def __str__(self) -> str:
+        return self.data.hex(" ").upper()
+
+    def __repr__(self) -> str:
+        return f"Frame({self.wire.decode('ascii')})"
+
+
 def counters_path(config_file_path):
     """Return the path to the counters directory"""
-    _config = read_config_file(config_file_path)
+    _config = read_settings(config_file_path)
     _counters_root = _config["counters_path"]
 
     if not os.path.isabs(_config["counters_path"]):
@@ -188,7 +415,7 @@ def counters_path(config_file_path):
 
 def shutter_id_and_counter(config_file_path, shutter_key) -> tuple:
     """Return the shutter id and counter"""
-    _config = read_config_file(config_file_path)
+    _config = read_settings(config_file_path)
     _counters_root = _config["counters_path"]
 
     if not os.path.isabs(_config["counters_path"]):
@@ -204,7 +431,7 @@ def shutter_id_and_counter(config_file_path, shutter_key) -> tuple:
 
 def increment_shutter_counter(config_file_path, shutter_key):
     """Increment the shutter counter"""
-    _config = read_config_file(config_file_path)
+    _config = read_settings(config_file_path)
     _counters_root = _config["counters_path"]
 
     if not os.path.isabs(_config["counters_path"]):
@@ -222,7 +449,7 @@ def increment_shutter_counter(config_file_path, shutter_key):
 
 def decrement_shutter_counter(config_file_path, shutter_key):
     """Decrement the shutter counter"""
-    _config = read_config_file(config_file_path)
+    _config = read_settings(config_file_path)
     _counters_root = _config["counters_path"]
     if not os.path.isabs(_config["counters_path"]):
         _counters_root = os.path.join(
@@ -251,6 +478,11 @@ if __name__ == "__main__":
 
     # Read each counter value or create counter file
     for name, conf in config["shutters"].items():
+        # The shutters served by another node have their counter there
+        if "id" not in conf:
+            print(f"{name} is served by the node {conf.get('node')}")
+            continue
+
         # int(conf["id"], 16)
         # print(conf["id"])
         counter_path = os.path.join(counters_root, f"{conf['id']}.txt")
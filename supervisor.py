@@ -0,0 +1,172 @@
+"""Supervise the serial link of the remote in the background."""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+
+from link import CommandLink
+from uart import UART
+
+# Time between two checks of the link (in seconds)
+DEFAULT_INTERVAL = 5
+
+# Maximum time between two reconnection attempts (in seconds)
+MAX_BACKOFF = 60
+
+# Maximum time to wait for the READY of the firmware after opening the port
+# (in seconds), the board may be resetting
+RECONNECT_TIMEOUT = 3
+
+
+class LinkSupervisor:
+    """Verify the serial link and reconnect it off the request path.
+
+    The link is considered alive while the firmware echoes commands. When
+    no echo has been received for `interval` seconds, the supervisor pings
+    the firmware. If the port is closed or the ping is not echoed, the
+    remote is reconnected with an exponential backoff. The requests only
+    read `connected`, and the health probes read the cached `health()`.
+    """
+
+    def __init__(
+        self,
+        remote: UART,
+        link: CommandLink,
+        interval: float = DEFAULT_INTERVAL,
+        logger: logging.Logger | None = None,
+    ) -> None:
+        self.remote = remote
+        self.link = link
+        self.interval = interval
+        self.logger = logger or logging.getLogger(__name__)
+        self.connected = False
+        self.reconnects = 0
+        self.last_check = None
+        self._backoff = interval
+        self._wake = threading.Event()
+        self._state_changed = threading.Condition()
+        self._running = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        """Start the supervisor thread."""
+        if self._thread is not None:
+            return
+
+        self._running.set()
+        self._thread = threading.Thread(
+            target=self._run, name="LinkSupervisor", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the supervisor thread."""
+        self._running.clear()
+        self._wake.set()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def report_failure(self) -> None:
+        """Ask for an immediate check, after a command was not echoed."""
+        self._wake.set()
+
+    def wait_connected(self, timeout: float) -> bool:
+        """Wait for the link to be (re)connected.
+
+        Returns:
+            bool: True if the link is connected.
+        """
+        with self._state_changed:
+            return self._state_changed.wait_for(
+                lambda: self.connected, timeout
+            )
+
+    def health(self) -> dict:
+        """Return a snapshot of the link health."""
+        last_echo = self.link.last_echo
+
+        return {
+            "connected": self.connected,
+            "mocking": self.remote.is_mocking(),
+            "last_echo": last_echo,
+            "last_echo_age": (
+                None if last_echo is None else time.time() - last_echo
+            ),
+            "last_check": self.last_check,
+            "reconnects": self.reconnects,
+            "in_flight": self.link.in_flight(),
+            "echo_latency": self.link.echo_latency(),
+        }
+
+    def _set_connected(self, connected: bool) -> None:
+        with self._state_changed:
+            if connected != self.connected:
+                self.logger.info(
+                    "The remote is now %s.",
+                    "connected" if connected else "disconnected",
+                )
+
+            self.connected = connected
+            self._state_changed.notify_all()
+
+    def _run(self) -> None:
+        while self._running.is_set():
+            try:
+                self.check()
+
+            except Exception:  # pylint: disable=broad-except
+                # Keep supervising whatever happens to the port
+                self.logger.exception("Could not check the remote.")
+                self._set_connected(False)
+
+            wait = self.interval if self.connected else self._backoff
+            self._wake.wait(wait)
+            self._wake.clear()
+
+    def check(self) -> bool:
+        """Verify the link and reconnect it if needed.
+
+        Returns:
+            bool: True if the link is connected.
+        """
+        self.last_check = time.time()
+
+        if self.remote.is_connected() and self._is_alive():
+            self._backoff = self.interval
+            self._set_connected(True)
+            return True
+
+        self._set_connected(False)
+        self.logger.info("Will try to reconnect the remote.")
+        self.reconnects += 1
+
+        if self.remote.reconnect(RECONNECT_TIMEOUT) and self._ping():
+            self._backoff = self.interval
+            self._set_connected(True)
+            return True
+
+        self.logger.error("Could not connect to the remote.")
+        self._backoff = min(self._backoff * 2, MAX_BACKOFF)
+        return False
+
+    def _is_alive(self) -> bool:
+        """Return True if the firmware echoed recently, or answers a ping."""
+        last_echo = self.link.last_echo
+
+        if last_echo is not None and time.time() - last_echo < self.interval:
+            return True
+
+        return self._ping()
+
+    def _ping(self) -> bool:
+        """Ping the firmware.
+
+        The ping is queued behind the frames in flight, so its deadline is
+        the one of the link, which includes their airtime.
+        """
+        response = self.link.send("PING")
+        return response is not None and b"PING" in response
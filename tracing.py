@@ -0,0 +1,167 @@
+"""Trace the requests from Home Assistant to the RF burst.
+
+Each request gets a trace ID, taken from its "X-Trace-Id" header or
+generated. The timed spans of the request (lock waits, decoding, serial
+write, echo wait, ...) are written to a local file, one event per line,
+in the Chrome trace event format ("X" complete events, the trace ID is in
+"args"). The file starts with "[" and each event line ends with ",", the
+format accepted as is by chrome://tracing, Perfetto (ui.perfetto.dev) and
+speedscope.
+
+Tracing is disabled until `configure()` is called, `span()` then costs a
+context variable lookup.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+
+import somfy_frame_generator as frame_generator
+
+# Rotate the trace file when it is larger than this (in bytes)
+MAX_FILE_SIZE = 50 * 1024**2
+
+_trace_id = contextvars.ContextVar("trace_id", default=None)
+
+
+def tracing_path(config_file_path: str) -> str | None:
+    """Return the path to the trace file, or None if tracing is disabled."""
+    _config = frame_generator.read_config_file(config_file_path)
+    _tracing = _config.get("Tracing", {})
+
+    if not _tracing.get("enable", False):
+        return None
+
+    _tracing_path = _tracing.get("path", "./traces.json")
+
+    if not os.path.isabs(_tracing_path):
+        _tracing_path = os.path.join(
+            os.path.dirname(config_file_path), _tracing_path.replace("./", "")
+        )
+
+    return _tracing_path
+
+
+def new_trace_id() -> str:
+    """Return a new trace ID (16 hexadecimal characters)."""
+    return uuid.uuid4().hex[:16]
+
+
+def current_trace_id() -> str | None:
+    """Return the trace ID of the current request, if any."""
+    return _trace_id.get()
+
+
+class Tracer:
+    """Write the timed spans to a trace file."""
+
+    def __init__(self) -> None:
+        self.path = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """Return True if the spans are recorded."""
+        return self._file is not None
+
+    def configure(self, path: str | None) -> None:
+        """Record the spans in a file, or stop recording if path is None."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+            self.path = path
+
+            if path is not None:
+                self._open()
+
+    def _open(self) -> None:
+        is_new = not os.path.exists(self.path)
+        # pylint: disable-next=consider-using-with
+        self._file = open(self.path, "a", encoding="utf-8", buffering=1)
+
+        if is_new or os.path.getsize(self.path) == 0:
+            self._file.write("[\n")
+
+    def record(
+        self, name: str, start: float, duration: float, **arguments
+    ) -> None:
+        """Record a span.
+
+        Args:
+            name (str): The name of the span.
+            start (float): The start time (epoch, in seconds).
+            duration (float): The duration in seconds.
+            arguments: The attributes of the span.
+        """
+        if self._file is None:
+            return
+
+        arguments.setdefault("trace_id", _trace_id.get())
+        event = {
+            "name": name,
+            "cat": name.split(".", 1)[0],
+            "ph": "X",
+            "ts": round(start * 1e6),
+            "dur": round(duration * 1e6),
+            "pid": os.getpid(),
+            "tid": threading.get_native_id(),
+            "args": arguments,
+        }
+        line = json.dumps(event, default=str, separators=(",", ":")) + ",\n"
+
+        with self._lock:
+            if self._file is None:
+                return
+
+            self._file.write(line)
+
+            if self._file.tell() > MAX_FILE_SIZE:
+                self._file.close()
+                os.replace(self.path, f"{self.path}.1")
+                self._open()
+
+    @contextlib.contextmanager
+    def span(self, name: str, **arguments):
+        """Time the enclosed block as a span of the current trace."""
+        if self._file is None or _trace_id.get() is None:
+            yield arguments
+            return
+
+        start = time.time()
+        start_counter = time.perf_counter()
+
+        try:
+            yield arguments
+
+        finally:
+            self.record(
+                name, start, time.perf_counter() - start_counter, **arguments
+            )
+
+    @contextlib.contextmanager
+    def trace(self, trace_id: str | None = None):
+        """Attach the enclosed block (and its spans) to a trace.
+
+        Yields:
+            str: The trace ID, generated if not given.
+        """
+        token = _trace_id.set(trace_id or new_trace_id())
+
+        try:
+            yield _trace_id.get()
+
+        finally:
+            _trace_id.reset(token)
+
+
+tracer = Tracer()
+span = tracer.span
@@ -3,11 +3,29 @@
 from __future__ import annotations
 
 import multiprocessing as mp
+import queue
+import threading
 import time
 
 import serial
 import serial.tools.list_ports as serial_list_ports
 
+from tracing import span
+from uart_capture import RX, TX, CaptureWriter
+
+try:
+    import termios
+
+except ImportError:  # Windows
+    termios = None
+
+# Line sent by the firmware when it is ready (after a reset, or as the
+# answer to a READY command)
+READY = b"READY"
+
+# Time between two READY commands while waiting for the firmware (in s)
+READY_RESEND_INTERVAL = 0.5
+
 
 class UART:
     """UART class to handle the serial port communication."""
@@ -18,13 +36,39 @@ class UART:
         baudrate: int = 115200,
         timeout: float = 0.1,
         mocking: bool = False,
+        transport=None,
+        capture_path: str | None = None,
+        reset_on_connect: bool = False,
     ) -> None:
-        self.ser = serial.Serial()
+        """Initialize the serial port (it is opened by `connect()`).
+
+        Args:
+            vid_pid: the VID:PID (and serial number) of the Arduino.
+            baudrate: the speed of the serial port.
+            timeout: the read timeout of the serial port.
+            mocking: mock the remote (the lines written are echoed).
+            transport: a port replacing `serial.Serial` (e.g. a
+            `uart_capture.ReplaySerial`), its port is not scanned.
+            capture_path: record the traffic in this capture file.
+            reset_on_connect: let the opening of the port reset the
+            Arduino (DTR), else the reset is avoided when possible.
+        """
+        self.ser = serial.Serial() if transport is None else transport
+        self.transport = transport
+        self.capture = (
+            None if capture_path is None else CaptureWriter(capture_path)
+        )
         self.vid_pid = vid_pid
         self.ser.baudrate = baudrate
         self.ser.timeout = timeout
         self.lock = mp.Lock()
         self.mock = mocking
+        self.reset_on_connect = reset_on_connect
+        # Lines echoed back when the remote is mocked
+        self._mock_echo = queue.SimpleQueue()
+        # Set once the firmware answered the handshake, the port is not
+        # read by read_available() meanwhile
+        self._ready = threading.Event()
 
     def get_port(self) -> bool:
         """Scan ports.
@@ -36,6 +80,9 @@ class UART:
         if self.mock:
             return None
 
+        if self.transport is not None:
+            return self.transport.port
+
         ls_ports = [tuple(p) for p in list(serial_list_ports.comports())]
 
         for port in ls_ports:
@@ -46,30 +93,110 @@ class UART:
     def connect(self, timeout: float = 0) -> bool:
         """Initiate the connection to the serial port.
 
+        Opening the port of an Arduino Uno asserts DTR, which resets the
+        board (about 2 s). Unless reset_on_connect is set, DTR is kept
+        asserted when the port is closed (HUPCL is cleared on POSIX, and
+        DTR is not asserted at all on Windows), so only the first opening
+        resets the board. The firmware then confirms that it is ready with
+        a handshake.
+
         Args:
-            timeout: time to wait before releasing the lock.
+            timeout: time to wait for the firmware to be ready.
+
+        Returns:
+            True, if the firmware is ready, else, False.
         """
         if self.mock:
             return True
 
+        self.lock.acquire()
+
         try:
-            self.lock.acquire()
-            self.ser.port = self.get_port()
+            self._ready.clear()
+            port = self.get_port()
+
+            # No port matches the VID (e.g. the Arduino is unplugged)
+            if port is False:
+                return False
+
+            self.ser.port = port
+
+            if not self.reset_on_connect and termios is None:
+                self.ser.dtr = False
+
             self.ser.open()
-            init_t = time.time()
 
-            # Wait for message or timeout
-            while not (time.time() - init_t >= timeout or self.ser.in_waiting):
-                continue
+            if not self.reset_on_connect:
+                self._keep_dtr_on_close()
 
-            time.sleep(0.01)
-            self.lock.release()
+            return self._wait_ready(time.monotonic() + timeout)
 
-            return self.ser.is_open
+        except (ConnectionError, serial.SerialException):
+            # The port could not be opened
+            return False
 
-        except ConnectionError:
+        finally:
             self.lock.release()
-            return False
+
+    def _keep_dtr_on_close(self) -> None:
+        """Do not drop DTR when the port is closed (no reset on reopen)."""
+        if termios is None or not hasattr(self.ser, "fileno"):
+            return
+
+        try:
+            attributes = termios.tcgetattr(self.ser.fileno())
+            attributes[2] &= ~termios.HUPCL
+            termios.tcsetattr(self.ser.fileno(), termios.TCSANOW, attributes)
+
+        except (termios.error, OSError, ValueError):
+            # Not a TTY (e.g. a pseudo-terminal or a socket bridge)
+            pass
+
+    def _wait_ready(self, deadline: float) -> bool:
+        """Wait until the firmware sends READY (the lock must be held).
+
+        READY is sent by the firmware at the end of its start-up, and as
+        the answer to a READY command, which is sent again regularly in
+        case the board was resetting. The reads block up to the deadline,
+        without spinning.
+
+        Args:
+            deadline: the time.monotonic() limit of the wait.
+
+        Returns:
+            True, if the firmware is ready, else, False.
+        """
+        self.ser.reset_input_buffer()
+        bytes_buffer = b""
+        next_ready = time.monotonic()
+
+        while True:
+            now = time.monotonic()
+
+            if now >= next_ready:
+                self.ser.write(READY + b"\n")
+                self.ser.flush()
+                next_ready = now + READY_RESEND_INTERVAL
+
+            # Block until a byte is received, the next READY or the deadline
+            timeout = self.ser.timeout
+            self.ser.timeout = max(0.001, min(deadline, next_ready) - now)
+
+            try:
+                data = self.ser.read(max(1, self.ser.in_waiting))
+
+            finally:
+                self.ser.timeout = timeout
+
+            bytes_buffer += data
+            *lines, bytes_buffer = bytes_buffer.split(b"\n")
+
+            if any(line.rstrip(b"\r") == READY for line in lines):
+                self._ready.set()
+                return True
+
+            if time.monotonic() >= deadline:
+                return False
 
     def disconnect(self) -> bool:
         """Disconnect the serial port.
@@ -81,6 +208,7 @@ class UART:
             return True
 
         self.lock.acquire()
+        self._ready.clear()
         self.ser.close()
         self.lock.release()
 
@@ -109,24 +237,35 @@ class UART:
             True if success, else, False.
         """
         if self.mock:
+            # Echo the complete lines like the firmware does
+            for line in bytes(_bytes).splitlines(keepends=True):
+                if line.endswith(b"\n"):
+                    self._mock_echo.put(line.rstrip(b"\r\n") + b"\r\n")
             return True
 
-        try:
-            if self.ser.is_open:
-                self.lock.acquire()
+        if not self.ser.is_open:
+            return False
+
+        with span("uart.write", size=len(_bytes), flush=flush):
+            self.lock.acquire()
+
+            try:
                 self.ser.write(_bytes)
 
+                if self.capture is not None:
+                    self.capture.record(TX, bytes(_bytes))
+
                 if flush:
                     self.ser.flush()
 
-                self.lock.release()
                 return True
 
-            return False
+            except (ConnectionError, serial.SerialException, OSError):
+                # E.g. the adapter was unplugged during the write
+                return False
 
-        except ConnectionError:
-            self.lock.release()
-            return False
+            finally:
+                self.lock.release()
 
     def send(self, message: str | bytes | any, flush: bool = True) -> None:
         """Write a message on the serial port.
@@ -174,12 +313,56 @@ class UART:
                 time.sleep(self.ser.timeout)
             self.lock.release()
 
+            if self.capture is not None:
+                self.capture.record(RX, bytes_buffer)
+
             return bytes_buffer
 
         except ConnectionError:
             self.lock.release()
             return False
 
+    def read_available(self) -> bytes | None:
+        """Wait for bytes on the serial port and read them.
+
+        The lock is not held while waiting, so the port can be written
+        at the same time. Wait up to the serial port timeout.
+
+        Returns:
+            The bytes read (may be empty), or None if the port is closed.
+        """
+        if self.mock:
+            try:
+                return self._mock_echo.get(timeout=self.ser.timeout)
+
+            except queue.Empty:
+                return b""
+
+        if not self.ser.is_open or not self._ready.is_set():
+            return None
+
+        try:
+            bytes_buffer = self.ser.read(1)
+
+            if bytes_buffer and self.ser.in_waiting:
+                bytes_buffer += self.ser.read(self.ser.in_waiting)
+
+            if self.capture is not None:
+                self.capture.record(RX, bytes_buffer)
+
+            return bytes_buffer
+
+        except (serial.SerialException, OSError, TypeError):
+            # The port has been closed or unplugged while reading
+            return None
+
+    def is_connected(self) -> bool:
+        """Return True if the serial port is open, without scanning ports."""
+        if self.mock:
+            return True
+
+        return self.ser.is_open
+
     def in_waiting(self) -> int:
         """Return the number of bytes in the input buffer."""
         if self.mock:
@@ -218,14 +401,7 @@ class UART:
                 self.ser.close()
                 self.ser.port = self.get_port()
                 self.ser.open()
-
-                # Wait for message or timeout
-                start_time = time.time()
-                while time.time() - start_time < timeout:
-
-                    if self.ser.in_waiting:
-                        time.sleep(0.01)
-                        break
+                self._wait_ready(time.monotonic() + timeout)
 
             self.lock.release()
             return self.ser.is_open
@@ -0,0 +1,310 @@
+"""Record and replay the traffic of the serial link.
+
+A capture is a compact binary log of every chunk written (TX) and read
+(RX) by `UART`, with monotonic timestamps:
+
+    header: b"RTSCAP1\\n"
+    record: direction (1 byte, 0 = TX, 1 = RX), time since the start of
+            the capture (8 bytes, ns), size (2 bytes), data
+    (little-endian)
+
+The records of each run of the service are appended to the capture, their
+times following those of the previous runs.
+
+`ReplaySerial` replaces the serial port of `UART` to play a capture back.
+The replay reacts to the host: each line written by the host is matched
+with the next recorded TX line of the same kind (frame, PING, PULSE, ...),
+so that the checks of the link do not shift the replay. The RX lines that
+answered it are played back with the recorded delays (divided by `speed`),
+the recorded TX line being replaced by the written one (so the tags and
+the rolling codes of the replay are echoed). The PING lines that were not
+recorded, and the READY handshake of `UART.connect()`, are echoed at
+once.
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import os
+import struct
+import threading
+import time
+from typing import Iterator
+
+MAGIC = b"RTSCAP1\n"
+RECORD = struct.Struct("<BQH")
+
+TX = 0
+RX = 1
+
+
+class CaptureWriter:
+    """Append the chunks of the serial link to a capture file."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._start = time.monotonic_ns() - _end_of_capture(path)
+        # pylint: disable-next=consider-using-with
+        self._file = open(path, "ab")
+
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+
+    def record(self, direction: int, data: bytes) -> None:
+        """Record a chunk written (TX) or read (RX)."""
+        if not data:
+            return
+
+        timestamp = time.monotonic_ns() - self._start
+
+        with self._lock:
+            if self._file.closed:
+                return
+
+            # The size is stored on 2 bytes, split the larger chunks
+            for offset in range(0, len(data), 0xFFFF):
+                chunk = data[offset : offset + 0xFFFF]
+                self._file.write(
+                    RECORD.pack(direction, timestamp, len(chunk)) + chunk
+                )
+
+            self._file.flush()
+
+    def close(self) -> None:
+        """Close the capture file."""
+        with self._lock:
+            self._file.close()
+
+
+def _end_of_capture(path: str) -> int:
+    """Return the time of the last record of a capture (in ns), or 0.
+
+    Raises:
+        ValueError: If the file exists but is not a capture.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return 0
+
+    end = 0
+
+    with open(path, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a capture of the serial link.")
+
+        while len(header := file.read(RECORD.size)) == RECORD.size:
+            _, end, size = RECORD.unpack(header)
+            file.seek(size, os.SEEK_CUR)
+
+    return end
+
+
+def read_capture(path: str) -> Iterator[tuple[int, float, bytes]]:
+    """Yield the (direction, time in seconds, data) records of a capture."""
+    with open(path, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a capture of the serial link.")
+
+        while header := file.read(RECORD.size):
+            direction, timestamp, size = RECORD.unpack(header)
+            yield direction, timestamp / 1e9, file.read(size)
+
+
+def _capture_lines(path: str) -> list[tuple[int, float, bytes]]:
+    """Return the (direction, time, line) of a capture, one per line.
+
+    A line is timed with the chunk that completed it.
+    """
+    lines = []
+    buffers = {TX: b"", RX: b""}
+
+    for direction, timestamp, data in read_capture(path):
+        buffers[direction] += data
+        *complete, buffers[direction] = buffers[direction].split(b"\n")
+        lines.extend(
+            (direction, timestamp, line + b"\n") for line in complete
+        )
+
+    return lines
+
+
+def _tag(line: bytes) -> bytes | None:
+    """Return the tag of a line ("#XX"), if any."""
+    return line[:3] if line.startswith(b"#") else None
+
+
+def _kind(line: bytes) -> bytes:
+    """Return the kind of command of a TX line (b"A7", b"PING", ...)."""
+    if _tag(line):
+        line = line[4:]
+
+    return line.strip().split(b" ", 1)[0].split(b"(", 1)[0].upper()
+
+
+def replay_script(path: str) -> list:
+    """Pair each recorded TX line with the RX lines that answered it.
+
+    An RX line with a tag answers the last TX line with the same tag, an
+    untagged RX line answers the last TX line.
+
+    Returns:
+        list: The (TX line, [(delay after the TX line, RX line), ...]).
+    """
+    script = []
+    last_by_tag = {}
+
+    for direction, timestamp, line in _capture_lines(path):
+        if direction == TX:
+            script.append((line, timestamp, []))
+            last_by_tag[_tag(line)] = script[-1]
+            continue
+
+        sent = last_by_tag.get(_tag(line)) if _tag(line) else None
+        sent = sent or (script[-1] if script else None)
+
+        if sent is not None:
+            sent[2].append((timestamp - sent[1], line))
+
+    return [(line, answers) for line, _, answers in script]
+
+
+class ReplaySerial:
+    """A serial port playing a capture back, for `UART(transport=...)`.
+
+    Only the part of the `serial.Serial` interface used by `UART` is
+    implemented.
+    """
+
+    def __init__(self, path: str, speed: float = 1.0) -> None:
+        """Initialize the replay.
+
+        Args:
+            path (str): The path to the capture.
+            speed (float, optional): The acceleration of the replay.
+            Defaults to 1.0 (original speed).
+        """
+        self.port = path
+        self.baudrate = 115200
+        self.timeout = 0.1
+        self.dtr = True
+        self.speed = speed
+        self.is_open = False
+        self._script = replay_script(path)
+        self._next = 0
+        self._tx_buffer = b""
+        self._pending = []
+        self._sequence = itertools.count()
+        self._rx_buffer = b""
+        self._condition = threading.Condition()
+
+    def open(self) -> None:
+        """Open the port."""
+        self.is_open = True
+
+    def close(self) -> None:
+        """Close the port."""
+        self.is_open = False
+
+    def write(self, data: bytes) -> int:
+        """Schedule the recorded answers of each complete line written."""
+        now = time.monotonic()
+
+        with self._condition:
+            self._tx_buffer += data
+            *lines, self._tx_buffer = self._tx_buffer.split(b"\n")
+
+            for line in lines:
+                recorded, answers = self._match(line + b"\n")
+
+                # The checks of the link that were not recorded are echoed
+                if recorded is None and _kind(line) in (b"PING", b"READY"):
+                    recorded, answers = line, [(0, line + b"\r\n")]
+
+                if recorded is None:
+                    continue
+
+                for delay, answer in answers:
+                    heapq.heappush(
+                        self._pending,
+                        (
+                            now + delay / self.speed,
+                            next(self._sequence),
+                            answer.replace(recorded.rstrip(b"\n"), line),
+                        ),
+                    )
+
+            self._condition.notify_all()
+
+        return len(data)
+
+    def _match(self, line: bytes) -> tuple[bytes | None, list]:
+        """Consume the next recorded TX line of the same kind as line."""
+        for index in range(self._next, len(self._script)):
+            if self._script[index] is None:
+                continue
+
+            if _kind(self._script[index][0]) == _kind(line):
+                recorded, answers = self._script[index]
+                self._script[index] = None
+
+                # Skip the lines consumed so far
+                while (
+                    self._next < len(self._script)
+                    and self._script[self._next] is None
+                ):
+                    self._next += 1
+
+                return recorded, answers
+
+        return None, []
+
+    def flush(self) -> None:
+        """Nothing to flush."""
+
+    def _release(self) -> None:
+        """Move the answers that are due to the input buffer."""
+        now = time.monotonic()
+
+        while self._pending and self._pending[0][0] <= now:
+            self._rx_buffer += heapq.heappop(self._pending)[2]
+
+    @property
+    def in_waiting(self) -> int:
+        """Return the number of bytes that can be read."""
+        with self._condition:
+            self._release()
+            return len(self._rx_buffer)
+
+    def read(self, size: int = 1) -> bytes:
+        """Read up to size bytes, wait up to the timeout for the first."""
+        deadline = time.monotonic() + (self.timeout or 0)
+
+        with self._condition:
+            while True:
+                self._release()
+
+                if self._rx_buffer or not self.is_open:
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+
+                if self._pending:
+                    remaining = min(
+                        remaining, self._pending[0][0] - time.monotonic()
+                    )
+
+                self._condition.wait(max(remaining, 0))
+
+            data, self._rx_buffer = (
+                self._rx_buffer[:size],
+                self._rx_buffer[size:],
+            )
+            return data
+
+    def reset_input_buffer(self) -> None:
+        """Drop the bytes that have been released."""
+        with self._condition:
+            self._rx_buffer = b""